@@ -0,0 +1,563 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+
+# Directory holding the persistent caches; override with the GRAPHRAG_CACHE_DIR environment variable
+DEFAULT_CACHE_DIR = os.getenv("GRAPHRAG_CACHE_DIR", ".cache")
+
+# One EmbeddingCache per directory for the whole process, so that writers share a single lock
+_embedding_caches = {}
+_embedding_caches_lock = threading.Lock()
+
+
+def content_hash(*parts):
+    """
+    Computes a SHA-256 hex digest over one or more strings.
+
+    Args:
+    - parts (str): The strings to be hashed, e.g. a chunk text, a model name and a prompt version.
+
+    Returns:
+    - str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def file_hash(path):
+    """
+    Computes the SHA-256 hex digest of a file's bytes.
+
+    Args:
+    - path (str): The path of the file.
+
+    Returns:
+    - str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Define the ConceptCache class
+class ConceptCache:
+    def __init__(self, path=None, max_memory_entries=10000):
+        """
+        Initializes a disk-backed concept cache with an in-memory LRU front.
+
+        Entries are keyed by a hash of the chunk text, the LLM model name and the prompt version, so the
+        cache never holds a copy of the chunk text and survives restarts.
+
+        Attributes:
+        - path: The path of the SQLite database.
+        - max_memory_entries: The maximum number of entries kept in the in-memory LRU front.
+        - memory: An OrderedDict holding the most recently used entries.
+        - hits: The number of lookups answered from memory or disk.
+        - misses: The number of lookups not found in the cache.
+        """
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "concepts.sqlite")
+        self.max_memory_entries = max_memory_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS concepts (key TEXT PRIMARY KEY, concepts TEXT NOT NULL)")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(text, model_name, prompt_version):
+        """
+        Builds the cache key of a chunk.
+
+        Args:
+        - text (str): The chunk text.
+        - model_name (str): The name of the LLM used for extraction.
+        - prompt_version (str): The version of the extraction prompt.
+
+        Returns:
+        - str: The cache key.
+        """
+        return content_hash(text, model_name, prompt_version)
+
+    def _remember(self, key, concepts):
+        """
+        Stores an entry in the in-memory LRU front, evicting the least recently used entries beyond the cap.
+
+        Args:
+        - key (str): The cache key.
+        - concepts (list of str): The cached concepts.
+
+        Returns:
+        - None
+        """
+        self.memory[key] = concepts
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Looks up the concepts of a chunk, first in memory and then on disk.
+
+        Args:
+        - key (str): The cache key.
+
+        Returns:
+        - list or None: The cached concepts, or None on a miss.
+        """
+        with self._lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+
+            row = self.connection.execute("SELECT concepts FROM concepts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            concepts = json.loads(row[0])
+            self._remember(key, concepts)
+            self.hits += 1
+            return concepts
+
+    def set_many(self, items):
+        """
+        Stores the concepts of several chunks in one transaction.
+
+        Args:
+        - items (list of tuple): A list of (key, concepts) pairs.
+
+        Returns:
+        - None
+        """
+        with self._lock:
+            for key, concepts in items:
+                self._remember(key, concepts)
+            self.connection.executemany("INSERT OR REPLACE INTO concepts (key, concepts) VALUES (?, ?)",
+                                        [(key, json.dumps(concepts)) for key, concepts in items])
+            self.connection.commit()
+
+    def set(self, key, concepts):
+        """
+        Stores the concepts of a chunk.
+
+        Args:
+        - key (str): The cache key.
+        - concepts (list of str): The concepts to be cached.
+
+        Returns:
+        - None
+        """
+        self.set_many([(key, concepts)])
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of the cache.
+
+        Args:
+        - None
+
+        Returns:
+        - dict: The hits, misses and number of entries held in memory.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'memory_entries': len(self.memory)}
+
+
+# Define the EmbeddingCache class
+class EmbeddingCache:
+    def __init__(self, directory=None, max_rows=500000):
+        """
+        Initializes a persistent embedding cache for a single embedding model.
+
+        Vectors are appended to a float32 file that is read through a memory map, and a SQLite index maps
+        each content hash to its row. Evicted rows are dropped from the index and the live rows are compacted
+        into a new file, whose generation is committed together with the new row numbers, so readers always
+        see rows and a file that match. Use EmbeddingCache.shared to get the process-wide instance of a
+        directory; appends and compaction also hold a SQLite write lock, so that writers in other processes
+        cannot claim the same rows.
+
+        Attributes:
+        - directory: The directory holding the vector file and its index.
+        - max_rows: The maximum number of vectors kept; least recently used vectors are evicted beyond it.
+        - dim: The embedding dimension, known once the first vector is stored.
+        - generation: The generation of the vector file, incremented by every compaction.
+        - hits: The number of lookups found in the cache.
+        - misses: The number of lookups not found in the cache.
+        """
+        self.directory = directory or os.path.join(DEFAULT_CACHE_DIR, "embeddings")
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._vectors_signature = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL, last_used INTEGER NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.connection.commit()
+        self.dim = self._meta("dim")
+        self._clock = self._meta("clock") or 0
+        self._follow_generation()
+
+    @classmethod
+    def shared(cls, directory=None, max_rows=500000):
+        """
+        Returns the process-wide cache of a directory, creating it on first use.
+
+        Args:
+        - directory (str): The directory holding the vector file and its index.
+        - max_rows (int): The maximum number of vectors kept, used when the cache is created.
+
+        Returns:
+        - EmbeddingCache: The cache of the directory.
+        """
+        directory = os.path.abspath(directory or os.path.join(DEFAULT_CACHE_DIR, "embeddings"))
+        with _embedding_caches_lock:
+            if directory not in _embedding_caches:
+                _embedding_caches[directory] = cls(directory, max_rows)
+            return _embedding_caches[directory]
+
+    @staticmethod
+    def make_key(text, model_name):
+        """
+        Builds the cache key of a text.
+
+        Args:
+        - text (str): The embedded text.
+        - model_name (str): The name of the embedding model.
+
+        Returns:
+        - str: The cache key.
+        """
+        return content_hash(text, model_name)
+
+    def _meta(self, name):
+        row = self.connection.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def _vectors_path(self, generation):
+        return os.path.join(self.directory, "vectors.f32" if generation == 0 else f"vectors.{generation}.f32")
+
+    def _follow_generation(self):
+        """
+        Points vectors_path at the vector file of the committed generation, which may have been compacted by another process.
+        """
+        self.generation = self._meta("generation") or 0
+        self.vectors_path = self._vectors_path(self.generation)
+
+    def _num_file_rows(self):
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def _memmap(self):
+        """
+        Returns a read-only memory map over the vector file, reopening it after the file has grown or been replaced.
+        """
+        num_rows = self._num_file_rows()
+        signature = None
+        if num_rows:
+            stat = os.stat(self.vectors_path)
+            signature = (self.vectors_path, stat.st_ino, stat.st_mtime_ns, num_rows)
+        if self._vectors is None or self._vectors_signature != signature:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(num_rows, self.dim)) if num_rows else None
+            self._vectors_signature = signature
+        return self._vectors
+
+    def lookup(self, keys):
+        """
+        Looks up the vectors of several keys at once.
+
+        Args:
+        - keys (list of str): The cache keys.
+
+        Returns:
+        - tuple: A tuple containing:
+          - found (numpy.ndarray): A boolean mask of the keys present in the cache.
+          - vectors (numpy.ndarray): The cached vectors of the found keys, in key order.
+        """
+        with self._lock:
+            # Read the rows, the generation and the vectors in one transaction, so a compaction cannot commit in between
+            self.connection.execute("BEGIN")
+            try:
+                row_of_key = {}
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    row_of_key.update(self.connection.execute(
+                        f"SELECT key, row FROM vectors WHERE key IN ({placeholders})", batch).fetchall())
+                if row_of_key:
+                    self.dim = self._meta("dim")
+                    self._follow_generation()
+                    rows = [row_of_key[key] for key in keys if key in row_of_key]
+                    vectors = np.array(self._memmap()[rows], dtype=np.float32)
+            finally:
+                self.connection.commit()
+
+            found = np.array([key in row_of_key for key in keys], dtype=bool)
+            self.hits += int(found.sum())
+            self.misses += len(keys) - int(found.sum())
+            if not row_of_key:
+                return found, np.empty((0, self.dim or 0), dtype=np.float32)
+
+            self._clock += 1
+            self.connection.executemany("UPDATE vectors SET last_used = ? WHERE key = ?",
+                                        [(self._clock, key) for key in row_of_key])
+            self._set_meta("clock", self._clock)
+            self.connection.commit()
+            return found, vectors
+
+    def put_many(self, keys, vectors):
+        """
+        Appends new vectors to the cache and evicts the least recently used ones beyond max_rows.
+
+        Args:
+        - keys (list of str): The cache keys.
+        - vectors (numpy.ndarray): The vectors to be stored, one row per key.
+
+        Returns:
+        - None
+        """
+        if not keys:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            # Hold the database write lock while the rows are claimed and appended, and while the file is compacted
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.dim = self._meta("dim")
+            self._clock = max(self._clock, self._meta("clock") or 0)
+            self._follow_generation()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_meta("dim", self.dim)
+            elif vectors.shape[1] != self.dim:
+                self.connection.rollback()
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            try:
+                first_row = self._num_file_rows()
+                with open(self.vectors_path, "ab") as f:
+                    f.write(vectors.tobytes())
+                self._clock += 1
+                self.connection.executemany("INSERT OR REPLACE INTO vectors (key, row, last_used) VALUES (?, ?, ?)",
+                                            [(key, first_row + i, self._clock) for i, key in enumerate(keys)])
+                self._set_meta("clock", self._clock)
+
+                num_live = self.connection.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+                if num_live > self.max_rows or self._num_file_rows() > 2 * max(num_live, 1):
+                    self._compact(num_live - self.max_rows)
+                else:
+                    self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                self._follow_generation()
+                raise
+
+    def _compact(self, num_rows):
+        """
+        Drops the num_rows least recently used vectors and copies the live rows into the file of the next generation.
+
+        Runs inside the write transaction of put_many. The new row numbers and the generation are committed
+        together, and the file of the previous generation is removed only afterwards.
+        """
+        if num_rows > 0:
+            self.connection.execute("DELETE FROM vectors WHERE key IN (SELECT key FROM vectors ORDER BY last_used LIMIT ?)",
+                                    (num_rows,))
+        live = self.connection.execute("SELECT key, row FROM vectors ORDER BY row").fetchall()
+        vectors = np.array(self._memmap()[[row for _, row in live]], dtype=np.float32) if live else np.empty((0, self.dim), dtype=np.float32)
+
+        old_path = self.vectors_path
+        new_path = self._vectors_path(self.generation + 1)
+        with open(new_path, "wb") as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            self.connection.executemany("UPDATE vectors SET row = ? WHERE key = ?",
+                                        [(new_row, key) for new_row, (key, _) in enumerate(live)])
+            self._set_meta("generation", self.generation + 1)
+            self.connection.commit()
+        except BaseException:
+            os.remove(new_path)
+            raise
+
+        self._vectors = None
+        self._vectors_signature = None
+        self._follow_generation()
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of the cache.
+
+        Args:
+        - None
+
+        Returns:
+        - dict: The hits, misses and number of stored vectors.
+        """
+        with self._lock:
+            self._follow_generation()
+            return {'hits': self.hits, 'misses': self.misses, 'rows': self._num_file_rows()}
+
+
+# Define the SemanticAnswerCache class
+class SemanticAnswerCache:
+    def __init__(self, threshold=None, ttl_seconds=3600, max_entries=256):
+        """
+        Initializes an in-memory answer cache matched by query text and, optionally, embedding similarity.
+
+        A query hits an entry if it has the same text, or, when a threshold is set, if its normalized embedding
+        has a cosine similarity of at least threshold with the entry's. Semantic hits are off by default:
+        related but different questions can be very similar in embedding space and would get each other's
+        answer, so a threshold should only be set after calibrating it on real queries. Entries only match
+        the graph version and traversal strategy they were computed with, expire after ttl_seconds and are
+        evicted least recently used first.
+
+        Attributes:
+        - threshold: The minimum cosine similarity of a semantic hit, or None to match exact query text only.
+        - ttl_seconds: The number of seconds after which an entry expires.
+        - max_entries: The maximum number of entries kept.
+        - entries: An OrderedDict of entries by (query text, strategy), least recently used first.
+        - hits: The number of lookups answered from the cache.
+        - misses: The number of lookups not found in the cache.
+        - lookup_seconds: The total time spent in lookups.
+        """
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _is_valid(self, entry, graph_version, strategy, now):
+        return entry['graph_version'] == graph_version and entry['strategy'] == strategy and now - entry['created_at'] <= self.ttl_seconds
+
+    def _hit(self, key, entry, start_time):
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.lookup_seconds += time.perf_counter() - start_time
+        return entry
+
+    def get_exact(self, query, graph_version, strategy):
+        """
+        Looks up an answer by query text, without embedding the query. Misses are only counted when no
+        threshold is set, since otherwise a semantic lookup follows.
+
+        Args:
+        - query (str): The query text.
+        - graph_version (int): The version of the knowledge graph.
+        - strategy (str): The traversal strategy.
+
+        Returns:
+        - dict or None: The cached entry, or None if there is no valid entry for the text.
+        """
+        start_time = time.perf_counter()
+        with self._lock:
+            entry = self.entries.get((query, strategy))
+            if entry is not None and self._is_valid(entry, graph_version, strategy, time.time()):
+                return self._hit((query, strategy), entry, start_time)
+            if self.threshold is None:
+                self.misses += 1
+            self.lookup_seconds += time.perf_counter() - start_time
+            return None
+
+    def get(self, query_vector, graph_version, strategy):
+        """
+        Looks up the answer of the most similar cached query, dropping expired and outdated entries.
+
+        Always misses when no threshold is set.
+
+        Args:
+        - query_vector (numpy.ndarray): The normalized query embedding.
+        - graph_version (int): The version of the knowledge graph.
+        - strategy (str): The traversal strategy.
+
+        Returns:
+        - dict or None: The cached entry, or None on a miss.
+        """
+        start_time = time.perf_counter()
+        with self._lock:
+            now = time.time()
+            for key in [key for key, entry in self.entries.items()
+                        if entry['graph_version'] != graph_version or now - entry['created_at'] > self.ttl_seconds]:
+                del self.entries[key]
+            candidates = [(key, entry) for key, entry in self.entries.items() if entry['strategy'] == strategy]
+            if candidates and self.threshold is not None:
+                similarities = np.stack([entry['query_vector'] for _, entry in candidates]) @ query_vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    return self._hit(candidates[best][0], candidates[best][1], start_time)
+            self.misses += 1
+            self.lookup_seconds += time.perf_counter() - start_time
+            return None
+
+    def put(self, query, query_vector, graph_version, strategy, answer, traversal_path, filtered_content):
+        """
+        Stores the answer of a query together with its traversal path.
+
+        Args:
+        - query (str): The query text.
+        - query_vector (numpy.ndarray): The normalized query embedding.
+        - graph_version (int): The version of the knowledge graph the answer was computed on.
+        - strategy (str): The traversal strategy.
+        - answer: The final answer.
+        - traversal_path (list of int): The traversal path of nodes in the knowledge graph.
+        - filtered_content (dict): The content of the traversed nodes.
+
+        Returns:
+        - None
+        """
+        with self._lock:
+            self.entries[(query, strategy)] = {
+                'query_vector': np.asarray(query_vector, dtype=np.float32),
+                'graph_version': graph_version,
+                'strategy': strategy,
+                'created_at': time.time(),
+                'answer': answer,
+                'traversal_path': list(traversal_path),
+                'filtered_content': dict(filtered_content),
+            }
+            self.entries.move_to_end((query, strategy))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Returns the hit rate and lookup latency of the cache.
+
+        Args:
+        - None
+
+        Returns:
+        - dict: The hits, misses, hit rate, mean lookup milliseconds and number of entries.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'mean_lookup_ms': 1000 * self.lookup_seconds / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+        }
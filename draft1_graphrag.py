@@ -1,11 +1,12 @@
 import networkx as nx
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import PromptTemplate
-from langchain.retrievers import ContextualCompressionRetriever
+from langchain_core.documents import Document
 from langchain.retrievers.document_compressors import LLMChainExtractor
 from langchain_community.callbacks import get_openai_callback
-from langchain_community.document_loaders import PyPDFLoader
+from pdf_extraction import extract_pdf_pages
 from sklearn.metrics.pairwise import cosine_similarity
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
@@ -21,12 +22,28 @@ import spacy
 import heapq
 from langchain_openai import OpenAIEmbeddings
 import streamlit as st
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections import Counter
 from tqdm import tqdm
 import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+import faiss
+import tiktoken
+import openai
+import asyncio
+import random
+import time
 from streamlit_chat import message
 from spacy.cli import download
 import tempfile
+import json
+import shutil
+import re
+import queue
+import threading
+from snapshot import SNAPSHOT_FORMAT_VERSION, StringStore, ChunkDocstore
+from caches import DEFAULT_CACHE_DIR, ConceptCache, EmbeddingCache, SemanticAnswerCache, content_hash, file_hash
 # os.environ["OPENAI_API_KEY"] = "api"
 
 sys.path.append(os.path.abspath(os.path.join(os.getcwd(), '..'))) # Add the parent directory to the path sicnce we work with notebooks
@@ -43,6 +60,86 @@ os.environ["KMP_DUPLICATE_LIB_OK"]="TRUE"
 nltk.download('punkt', quiet=True)
 nltk.download('wordnet', quiet=True)
 
+_token_encoding = None
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+def count_tokens(text):
+    """
+    Counts the tokens in a text with the local tiktoken tokenizer used by gpt-4o models.
+    
+    Args:
+    - text (str): The text to be tokenized.
+    
+    Returns:
+    - int: The number of tokens in the text.
+    """
+    global _token_encoding
+    if _token_encoding is None:
+        _token_encoding = tiktoken.get_encoding("o200k_base")
+    return len(_token_encoding.encode(text, disallowed_special=()))
+
+def split_sentences(text):
+    """
+    Splits a text into sentences at sentence-ending punctuation followed by whitespace.
+    
+    Args:
+    - text (str): The text to be split.
+    
+    Returns:
+    - list: The non-empty sentences of the text.
+    """
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text.strip()) if sentence]
+
+def run_coroutine(coroutine):
+    """
+    Runs a coroutine to completion from synchronous code.
+    
+    If the calling thread already runs an event loop (as some notebook and Streamlit setups do),
+    the coroutine is run on a fresh loop in a worker thread instead.
+    
+    Args:
+    - coroutine: The coroutine to be run.
+    
+    Returns:
+    - The result of the coroutine.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+def is_retryable_error(error):
+    """
+    Checks whether an LLM error is transient: a rate limit (429), a server error (5xx) or a connection problem.
+    
+    Args:
+    - error (Exception): The error raised by the LLM call.
+    
+    Returns:
+    - bool: True if the call should be retried.
+    """
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+def split_each_document(text_splitter, documents):
+    """
+    Splits documents one at a time, so that the chunks of each document can be put back in place; runs in a worker process.
+    
+    Args:
+    - text_splitter: The text splitter.
+    - documents (list of Document): The documents to be split.
+    
+    Returns:
+    - list: One list of chunks per document.
+    """
+    return [text_splitter.split_documents([document]) for document in documents]
+
 # Define the DocumentProcessor class
 class DocumentProcessor:
     def __init__(self):
@@ -52,26 +149,42 @@ class DocumentProcessor:
         Attributes:
         - text_splitter: An instance of RecursiveCharacterTextSplitter with specified chunk size and overlap.
         - embeddings: An instance of OpenAIEmbeddings used for embedding documents.
+        - split_workers: The number of processes splitting documents in parallel, one source document per task.
         """
         self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
         # self.embeddings = OpenAIEmbeddings()
         self.embeddings = OpenAIEmbeddings()
+        self.split_workers = 1
 
     def process_documents(self, documents):
         """
-        Processes a list of documents by splitting them into smaller chunks and creating a vector store.
+        Processes a list of documents by splitting them into smaller chunks.
+        
+        The chunks are embedded once by the KnowledgeGraph, which also builds the vector store from
+        that same embedding matrix. Every chunk keeps the metadata of its document, such as the source file
+        and page, and the pages of each source are split in a separate process when split_workers > 1.
         
         Args:
-        - documents (list of str): A list of documents to be processed.
+        - documents (list of Document): A list of documents to be processed, e.g. one per PDF page.
         
         Returns:
-        - tuple: A tuple containing:
-          - splits (list of str): The list of split document chunks.
-          - vector_store (FAISS): A FAISS vector store created from the split document chunks and their embeddings.
+        - list: The list of split document chunks, in document order.
         """
-        splits = self.text_splitter.split_documents(documents)
-        vector_store = FAISS.from_documents(splits, self.embeddings)
-        return splits, vector_store
+        if self.split_workers <= 1 or not documents:
+            return self.text_splitter.split_documents(documents)
+        
+        # Split the documents of each source in one task, then put their chunks back in input order
+        positions_by_source = {}
+        for position, document in enumerate(documents):
+            positions_by_source.setdefault(document.metadata.get('source'), []).append(position)
+        splits_by_position = [None] * len(documents)
+        with ProcessPoolExecutor(max_workers=min(self.split_workers, len(positions_by_source))) as executor:
+            split_groups = executor.map(split_each_document, [self.text_splitter] * len(positions_by_source),
+                                        [[documents[position] for position in positions] for positions in positions_by_source.values()])
+            for positions, document_splits in zip(positions_by_source.values(), split_groups):
+                for position, splits in zip(positions, document_splits):
+                    splits_by_position[position] = splits
+        return [split for splits in splits_by_position for split in splits]
 
     def create_embeddings_batch(self, texts, batch_size=32):
         """
@@ -108,6 +221,26 @@ class DocumentProcessor:
 class Concepts(BaseModel):
     concepts_list: List[str] = Field(description="List of concepts")
 
+# Define the ChunkConcepts and BatchConcepts classes used for multi-chunk extraction
+class ChunkConcepts(BaseModel):
+    chunk_id: int = Field(description="The id of the chunk the concepts were extracted from")
+    concepts_list: List[str] = Field(description="List of concepts")
+
+class BatchConcepts(BaseModel):
+    chunks: List[ChunkConcepts] = Field(description="The extracted concepts, one entry per chunk")
+
+NAMED_ENTITY_LABELS = ["PERSON", "ORG", "GPE", "WORK_OF_ART"]
+NER_DISABLED_PIPES = ["parser", "lemmatizer", "attribute_ruler"]
+# Metadata key holding a chunk's id, which is also its split index, graph node id and docstore id
+CHUNK_ID_KEY = "chunk_id"
+# Bump when the extraction prompts or entity labels change, so cached concepts are not reused
+CONCEPT_PROMPT_VERSION = "1"
+CONCEPT_EXTRACTION_TEMPLATE = "Extract key concepts (excluding named entities) from the following text:\n\n{text}\n\nKey concepts:"
+BATCH_CONCEPT_EXTRACTION_TEMPLATE = (
+    "Extract key concepts (excluding named entities) from each of the following text chunks. "
+    "Return one entry per chunk, using the id shown in the chunk's header.\n\n{chunks}\n\nKey concepts per chunk:"
+)
+
 # Define the KnowledgeGraph class
 class KnowledgeGraph:
     def __init__(self):
@@ -115,22 +248,104 @@ class KnowledgeGraph:
         Initializes the KnowledgeGraph with a graph, lemmatizer, and NLP model.
         
         Attributes:
-        - graph: An instance of a networkx Graph.
+        - graph: An instance of a networkx Graph (built on first access when loaded from a snapshot).
         - lemmatizer: An instance of WordNetLemmatizer.
-        - concept_cache: A dictionary to cache extracted concepts.
-        - nlp: An instance of a spaCy NLP model.
+        - concept_cache: A persistent ConceptCache keyed by chunk text hash, LLM model name and prompt version.
+        - nlp: An instance of a spaCy NLP model (loaded on first access).
         - edges_threshold: A float value that sets the threshold for adding edges based on similarity.
+        - embeddings: A contiguous float32 matrix with one row per node, shared with the vector store.
+        - vector_store: A FAISS vector store built from the embeddings matrix.
+        - embedding_counts: A Counter of how many times each chunk text was sent to the embedding model during the last build.
+        - edge_block_size: The number of rows compared per block when adding edges.
+        - edge_mode: How edge candidates are found: "exact" compares all pairs, "range" and "knn" query the FAISS index.
+        - knn_k: The number of neighbors retrieved per node in "knn" mode.
+        - index_factory: An optional FAISS index factory string (e.g. "HNSW32") used instead of a flat index.
+        - concept_ids: A dictionary interning every lemmatized concept to an integer id.
+        - concept_incidence: A scipy.sparse CSR matrix of shape (num_nodes, num_concepts) marking each node's concepts.
+        - concept_batch_tokens: The token budget of chunk text packed into one concept extraction request (0 disables batching).
+        - concept_batch_max_chunks: The maximum number of chunks packed into one concept extraction request.
+        - build_stats: A dictionary of statistics about the last build.
+        - async_concept_extraction: Whether concepts are extracted with asyncio instead of a thread pool.
+        - concept_concurrency: The maximum number of concept extraction requests in flight in async mode.
+        - concept_max_retries: The number of retries for a rate-limited or failed request in async mode.
+        - concept_backoff_base: The base delay in seconds of the exponential backoff between retries.
+        - concept_backoff_max: The maximum delay in seconds between retries.
+        - ner_batch_size: The number of documents per nlp.pipe batch during named entity extraction.
+        - ner_n_process: The number of processes used by nlp.pipe during named entity extraction.
+        - embedding_caches: A dictionary of persistent EmbeddingCache instances, one per embedding model.
+        - row_chunk_ids: An array mapping each FAISS row to its chunk id; chunk ids are split indices, graph
+          node ids and docstore ids, and are stored in each document's metadata under CHUNK_ID_KEY. Nodes
+          missing from it have been retired (see retire_nodes).
+        - token_counts: An array holding the number of tokens of each chunk, counted once at build time.
+        - embed_sentences: Whether the sentences of every chunk are embedded at build time for local compression.
+        - sentence_embeddings: A float32 array of normalized sentence embeddings, grouped by chunk.
+        - sentence_offsets: An array of length num_nodes + 1; the sentences of node n are rows
+          sentence_offsets[n]:sentence_offsets[n + 1] of sentence_embeddings.
+        - chunk_store, concept_store, metadata_store: StringStores backing node data when loaded from a snapshot.
+        - version: A counter increased whenever the graph changes, so that cached answers can be invalidated.
         """
         self.graph = nx.Graph()
         self.lemmatizer = WordNetLemmatizer()
-        self.concept_cache = {}
-        self.nlp = self._load_spacy_model()
+        self.concept_cache = ConceptCache()
+        self._nlp = None
         self.edges_threshold = 0.8
+        self.embeddings = None
+        self.vector_store = None
+        self.embedding_counts = Counter()
+        self.edge_block_size = 1024
+        self.edge_mode = "exact"
+        self.knn_k = 32
+        self.index_factory = None
+        self.concept_ids = {}
+        self.concept_incidence = None
+        self.concept_batch_tokens = 3000
+        self.concept_batch_max_chunks = 16
+        self.build_stats = {}
+        self.async_concept_extraction = True
+        self.concept_concurrency = 8
+        self.concept_max_retries = 5
+        self.concept_backoff_base = 1.0
+        self.concept_backoff_max = 30.0
+        self.ner_batch_size = 64
+        self.ner_n_process = 1
+        self.embedding_caches = {}
+        self.row_chunk_ids = None
+        self.token_counts = None
+        self.embed_sentences = True
+        self.sentence_embeddings = None
+        self.sentence_offsets = None
+        self.chunk_store = None
+        self.concept_store = None
+        self.metadata_store = None
+        self._edges = None
+        self._adjacency = None
+        self._transition = None
+        self._distances = None
+        self.version = 0
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = self._materialize_graph()
+        return self._graph
+
+    @graph.setter
+    def graph(self, graph):
+        self._graph = graph
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self._nlp = self._load_spacy_model()
+        return self._nlp
 
     def build_graph(self, splits, llm, embedding_model):
         """
         Builds the knowledge graph by adding nodes, creating embeddings, extracting concepts, and adding edges.
         
+        Every chunk is embedded exactly once; the resulting matrix is kept on the graph and reused
+        for both the FAISS vector store and edge construction.
+        
         Args:
         - splits (list): A list of document splits.
         - llm: An instance of a large language model.
@@ -139,160 +354,1316 @@ class KnowledgeGraph:
         Returns:
         - None
         """
+        self.embedding_counts = Counter()
+        self.build_stats = {}
+        self.graph = nx.Graph()
+        self.concept_ids = {}
+        self._edges = None
+        self._invalidate_edge_caches()
         self._add_nodes(splits)
-        embeddings = self._create_embeddings(splits, embedding_model)
+        self.embeddings = self._create_embeddings(splits, embedding_model)
+        if self.embed_sentences:
+            self.sentence_embeddings, self.sentence_offsets = self._create_sentence_embeddings(splits, embedding_model)
+        else:
+            self.sentence_embeddings, self.sentence_offsets = None, None
+        self.vector_store = self._create_vector_store(splits, embedding_model)
         self._extract_concepts(splits, llm)
-        self._add_edges(embeddings)
+        self.concept_incidence = self._build_concept_incidence()
+        self._edges = self._add_edges(self.embeddings)
+        self.distance_matrix()
+
+    def add_splits(self, splits, llm, embedding_model):
+        """
+        Adds document splits to the knowledge graph without rebuilding it.
+        
+        The new chunks get the next node ids, so existing node ids stay valid. Only the new chunks are
+        embedded and sent to concept extraction; they are appended to the FAISS index, and edges are added
+        only between new nodes and the indexed nodes (see _candidate_pairs). The first call on an empty
+        graph builds it with build_graph. The model calls run before any state is changed, and the new
+        nodes are removed again if concept extraction fails, so a failed call leaves the graph as it was.
+        
+        Args:
+        - splits (list): A list of new document splits.
+        - llm: An instance of a large language model.
+        - embedding_model: An instance of an embedding model.
+        
+        Returns:
+        - numpy.ndarray: The node ids of the new splits.
+        """
+        if self.vector_store is None:
+            self.build_graph(splits, llm, embedding_model)
+            return np.arange(len(splits), dtype=np.int64)
+        if not splits:
+            return np.empty(0, dtype=np.int64)
+        
+        self.embedding_counts = Counter()
+        self.build_stats = {}
+        first_node = self.embeddings.shape[0]
+        nodes = np.arange(first_node, first_node + len(splits), dtype=np.int64)
+        
+        new_embeddings = self._create_embeddings(splits, embedding_model)
+        if self.sentence_offsets is not None:
+            sentence_embeddings, sentence_offsets = self._create_sentence_embeddings(splits, embedding_model)
+        
+        # Concepts are stored on the graph nodes, so the nodes are added first and removed if extraction fails
+        token_counts = self.token_counts
+        self._add_nodes(splits, first_node)
+        try:
+            self._extract_concepts(splits, llm, nodes.tolist())
+        except Exception:
+            self.graph.remove_nodes_from(nodes.tolist())
+            self.token_counts = token_counts
+            raise
+        
+        self.embeddings = np.concatenate([self.embeddings, new_embeddings])
+        if self.sentence_offsets is not None:
+            self.sentence_embeddings = np.concatenate([self.sentence_embeddings, sentence_embeddings])
+            self.sentence_offsets = np.concatenate([self.sentence_offsets[:-1], sentence_offsets + self.sentence_offsets[-1]])
+        metadatas = [{**split.metadata, CHUNK_ID_KEY: int(node)} for node, split in zip(nodes, splits)]
+        self.vector_store.add_embeddings(zip((split.page_content for split in splits), new_embeddings),
+                                         metadatas=metadatas, ids=[str(node) for node in nodes])
+        self.row_chunk_ids = np.concatenate([self.row_chunk_ids, nodes])
+        
+        new_incidence = self._build_concept_incidence(nodes.tolist())
+        incidence = self.concept_incidence
+        incidence = sparse.csr_matrix((incidence.data, incidence.indices, incidence.indptr),
+                                      shape=(incidence.shape[0], len(self.concept_ids)))
+        self.concept_incidence = sparse.vstack([incidence, new_incidence], format="csr")
+        
+        # Append the new edges to the edge arrays, so the matrices are rebuilt with NumPy alone
+        edges = self._edge_arrays()
+        self._edges = tuple(np.concatenate([old, new]) for old, new in zip(edges, self._add_edges(self.embeddings, nodes)))
+        self._invalidate_edge_caches()
+        self.distance_matrix()
+        return nodes
+
+    def retire_nodes(self, nodes):
+        """
+        Removes nodes from the FAISS index, the docstore and the networkx graph, so they are no longer retrieved,
+        traversed or drawn.
+        
+        A node is live while it is in row_chunk_ids. Retired node ids are never reused, so the ids of all other
+        nodes stay valid: their rows of the embeddings and token_counts arrays are kept, while their concept
+        incidence rows and sentence embeddings are dropped, and save writes empty strings for them. Flat
+        indexes remove the rows in place; other indexes are reset and refilled from the embeddings of the
+        remaining nodes, so that index rows keep mapping to row_chunk_ids.
+        
+        Args:
+        - nodes (list of int): The nodes to be retired.
+        
+        Returns:
+        - None
+        """
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        nodes = nodes[np.isin(nodes, self.row_chunk_ids)] if self.row_chunk_ids is not None else nodes[:0]
+        if len(nodes) == 0:
+            return
+        edges = self._edge_arrays()
+        self.graph.remove_nodes_from(nodes.tolist())
+        self.vector_store.docstore.delete([str(node) for node in nodes.tolist()])
+        
+        is_retired = np.zeros(self.embeddings.shape[0], dtype=bool)
+        is_retired[nodes] = True
+        sources, targets = edges[0], edges[1]
+        keep = ~(is_retired[sources] | is_retired[targets])
+        self._edges = tuple(np.asarray(array)[keep] for array in edges)
+        self.concept_incidence = sparse.diags((~is_retired).astype(np.float32)).dot(self.concept_incidence).tocsr()
+        self.concept_incidence.eliminate_zeros()
+        if self.sentence_offsets is not None:
+            sentence_counts = np.diff(self.sentence_offsets)
+            self.sentence_embeddings = np.ascontiguousarray(self.sentence_embeddings[np.repeat(~is_retired, sentence_counts)])
+            sentence_counts[nodes] = 0
+            self.sentence_offsets = np.zeros(len(sentence_counts) + 1, dtype=np.int64)
+            np.cumsum(sentence_counts, out=self.sentence_offsets[1:])
+        
+        rows = np.flatnonzero(is_retired[self.row_chunk_ids])
+        self.row_chunk_ids = np.delete(self.row_chunk_ids, rows)
+        index = self.vector_store.index
+        if isinstance(faiss.downcast_index(index), faiss.IndexFlat):
+            index.remove_ids(rows.astype(np.int64))
+        else:
+            index.reset()
+            index.add(np.ascontiguousarray(self.embeddings[self.row_chunk_ids]))
+        self.vector_store.index_to_docstore_id = {row: str(node) for row, node in enumerate(self.row_chunk_ids.tolist())}
+        self._invalidate_edge_caches()
+
+    def page_nodes(self, pages):
+        """
+        Returns the indexed nodes whose chunks come from the given pages.
+        
+        Args:
+        - pages (set of tuple): The (source, page) of every page.
+        
+        Returns:
+        - list: The node ids.
+        """
+        if self.row_chunk_ids is None or not pages:
+            return []
+        return [node for node in self.row_chunk_ids.tolist()
+                if (self.graph.nodes[node].get('source'), self.graph.nodes[node].get('page')) in pages]
+
+    def _invalidate_edge_caches(self):
+        """
+        Drops the matrices derived from the edge arrays after the graph changed, and bumps the version.
+        
+        The edge arrays themselves are kept up to date by build_graph, add_splits and retire_nodes.
+        
+        Args:
+        - None
+        
+        Returns:
+        - None
+        """
+        self._adjacency = None
+        self._transition = None
+        self._distances = None
+        self.version += 1
+
+    def _add_nodes(self, splits, first_node=0):
+        """
+        Adds nodes to the graph from the document splits, keeping the source file and page of each split.
+        
+        Args:
+        - splits (list): A list of document splits.
+        - first_node (int, optional): The node id of the first split. Default is 0.
+        
+        Returns:
+        - None
+        """
+        for i, split in enumerate(splits, start=first_node):
+            self.graph.add_node(i, content=split.page_content, source=split.metadata.get('source'), page=split.metadata.get('page'))
+        token_counts = np.array([count_tokens(split.page_content) for split in splits], dtype=np.int32)
+        self.token_counts = token_counts if first_node == 0 else np.concatenate([self.token_counts, token_counts])
+
+    def _create_embeddings(self, splits, embedding_model):
+        """
+        Creates embeddings for the document splits using the embedding model.
+        
+        Vectors are looked up in the persistent embedding cache first and only the misses are sent to the
+        embedding model, in one batch. Duplicate chunk texts are sent only once, and every text that is sent
+        is recorded in embedding_counts. Rows are L2-normalized so that distances in the FAISS index map
+        directly to cosine similarities.
+        
+        Args:
+        - splits (list): A list of document splits.
+        - embedding_model: An instance of an embedding model.
+        
+        Returns:
+        - numpy.ndarray: A contiguous float32 array of embeddings, one row per split.
+        """
+        texts = [split.page_content for split in splits]
+        unique_texts = list(dict.fromkeys(texts))
+        vectors = self._embed_texts(unique_texts, embedding_model)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        
+        if len(unique_texts) == len(texts):
+            return np.ascontiguousarray(vectors)
+        row_of_text = {text: row for row, text in enumerate(unique_texts)}
+        return vectors[[row_of_text[text] for text in texts]]
+
+    def _create_sentence_embeddings(self, splits, embedding_model):
+        """
+        Embeds the sentences of every split, so that retrieved chunks can be compressed without an LLM.
+        
+        Sentences go through the same persistent cache as chunks, so single-sentence chunks and repeated
+        sentences are not sent to the embedding model again.
+        
+        Args:
+        - splits (list): A list of document splits.
+        - embedding_model: An instance of an embedding model.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - sentence_embeddings (numpy.ndarray): The normalized embedding of every sentence, grouped by split.
+          - sentence_offsets (numpy.ndarray): An array of length len(splits) + 1 delimiting the sentences of each split.
+        """
+        sentences = [split_sentences(split.page_content) for split in splits]
+        sentence_offsets = np.zeros(len(splits) + 1, dtype=np.int64)
+        np.cumsum([len(chunk_sentences) for chunk_sentences in sentences], out=sentence_offsets[1:])
+        texts = [sentence for chunk_sentences in sentences for sentence in chunk_sentences]
+        if not texts:
+            return np.empty((0, self.embeddings.shape[1]), dtype=np.float32), sentence_offsets
+        
+        unique_texts = list(dict.fromkeys(texts))
+        vectors = self._embed_texts(unique_texts, embedding_model)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+        row_of_text = {text: row for row, text in enumerate(unique_texts)}
+        return np.ascontiguousarray(vectors[[row_of_text[text] for text in texts]]), sentence_offsets
+
+    def sentence_vectors(self, node):
+        """
+        Returns the sentences of a node with their normalized embeddings.
+        
+        Args:
+        - node (int): The node id.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - sentences (list of str): The sentences of the node.
+          - vectors (numpy.ndarray): The embedding of each sentence.
+        """
+        start, stop = int(self.sentence_offsets[node]), int(self.sentence_offsets[node + 1])
+        return split_sentences(self.node_content(node)), np.asarray(self.sentence_embeddings[start:stop])
+
+    def _embedding_cache(self, embedding_model):
+        """
+        Returns the persistent embedding cache of an embedding model, creating it on first use.
+        
+        Args:
+        - embedding_model: An instance of an embedding model.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - cache (EmbeddingCache): The embedding cache of the model.
+          - model_name (str): The name of the model, part of every cache key.
+        """
+        model_name = getattr(embedding_model, 'model', None) or type(embedding_model).__name__
+        if model_name not in self.embedding_caches:
+            directory = os.path.join(DEFAULT_CACHE_DIR, "embeddings", content_hash(model_name)[:16])
+            self.embedding_caches[model_name] = EmbeddingCache.shared(directory)
+        return self.embedding_caches[model_name], model_name
+
+    def _embed_texts(self, texts, embedding_model):
+        """
+        Embeds unique texts, reading cached vectors and sending only the misses to the embedding model.
+        
+        Args:
+        - texts (list of str): The unique texts to be embedded.
+        - embedding_model: An instance of an embedding model.
+        
+        Returns:
+        - numpy.ndarray: A float32 array of raw embeddings, one row per text.
+        """
+        cache, model_name = self._embedding_cache(embedding_model)
+        keys = [EmbeddingCache.make_key(text, model_name) for text in texts]
+        found, cached_vectors = cache.lookup(keys)
+        missing = np.flatnonzero(~found)
+        
+        if len(missing):
+            missing_texts = [texts[i] for i in missing]
+            new_vectors = np.asarray(embedding_model.embed_documents(missing_texts), dtype=np.float32)
+            self.embedding_counts.update(missing_texts)
+            cache.put_many([keys[i] for i in missing], new_vectors)
+        
+        dim = new_vectors.shape[1] if len(missing) else cached_vectors.shape[1]
+        vectors = np.empty((len(texts), dim), dtype=np.float32)
+        if found.any():
+            vectors[found] = cached_vectors
+        if len(missing):
+            vectors[missing] = new_vectors
+        
+        self.build_stats['embedding_cache_hits'] = self.build_stats.get('embedding_cache_hits', 0) + int(found.sum())
+        self.build_stats['embedding_cache_misses'] = self.build_stats.get('embedding_cache_misses', 0) + len(missing)
+        return vectors
+
+    def _create_vector_store(self, splits, embedding_model):
+        """
+        Creates a FAISS vector store from the already computed embeddings matrix.
+        
+        A flat L2 index is used unless index_factory names an approximate index.
+        
+        Args:
+        - splits (list): A list of document splits.
+        - embedding_model: An instance of an embedding model, used by the vector store to embed queries.
+        
+        Returns:
+        - FAISS: A FAISS vector store over the document splits.
+        """
+        text_embeddings = zip((split.page_content for split in splits), self.embeddings)
+        metadatas = [{**split.metadata, CHUNK_ID_KEY: node} for node, split in enumerate(splits)]
+        ids = [str(node) for node in range(len(splits))]  # Docstore ids are node ids
+        self.row_chunk_ids = np.arange(len(splits), dtype=np.int64)
+        if self.index_factory is None:
+            return FAISS.from_embeddings(text_embeddings, embedding_model, metadatas=metadatas, ids=ids)
+        
+        index = faiss.index_factory(self.embeddings.shape[1], self.index_factory)
+        if not index.is_trained:
+            index.train(self.embeddings)
+        vector_store = FAISS(embedding_model, index, InMemoryDocstore(), {})
+        vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return vector_store
+
+    def _compute_similarity_blocks(self, embeddings, block_size):
+        """
+        Computes cosine similarities one row block at a time and yields the pairs above the edge threshold.
+        
+        Only the upper triangle (node1 < node2) is considered, and each block is compared against the
+        rows from its own start onwards, so peak memory is bounded by block_size * num_nodes.
+        
+        Args:
+        - embeddings (numpy.ndarray): An array of embeddings, one row per node.
+        - block_size (int): The number of rows compared per block.
+        
+        Yields:
+        - tuple: A tuple containing:
+          - rows (numpy.ndarray): The first node of each candidate pair.
+          - cols (numpy.ndarray): The second node of each candidate pair.
+          - similarities (numpy.ndarray): The cosine similarity of each candidate pair.
+        """
+        norms = np.linalg.norm(embeddings, axis=1)
+        norms[norms == 0] = 1.0
+        num_nodes = embeddings.shape[0]
+        
+        for start in range(0, num_nodes, block_size):
+            stop = min(start + block_size, num_nodes)
+            similarities = embeddings[start:stop] @ embeddings[start:].T
+            similarities /= norms[start:stop, None]
+            similarities /= norms[None, start:]
+            
+            rows, cols = np.nonzero(similarities > self.edges_threshold)
+            upper = cols > rows
+            rows, cols = rows[upper], cols[upper]
+            yield rows + start, cols + start, similarities[rows, cols]
+
+    def _compute_new_node_blocks(self, nodes, block_size):
+        """
+        Computes the cosine similarities between new nodes and every indexed node one block of new nodes at a time.
+        
+        Rows are unit length, so similarities are plain dot products. A pair of two new nodes is yielded once.
+        
+        Args:
+        - nodes (numpy.ndarray): The new nodes.
+        - block_size (int): The number of new nodes compared per block.
+        
+        Yields:
+        - tuple: A tuple containing:
+          - rows (numpy.ndarray): The new node of each candidate pair.
+          - cols (numpy.ndarray): The other node of each candidate pair.
+          - similarities (numpy.ndarray): The cosine similarity of each candidate pair.
+        """
+        indexed = np.asarray(self.row_chunk_ids)
+        indexed_embeddings = self.embeddings[indexed]
+        is_new = np.zeros(self.embeddings.shape[0], dtype=bool)
+        is_new[nodes] = True
+        
+        for start in range(0, len(nodes), block_size):
+            block = nodes[start:start + block_size]
+            similarities = self.embeddings[block] @ indexed_embeddings.T
+            block_rows, block_cols = np.nonzero(similarities > self.edges_threshold)
+            rows, cols = block[block_rows], indexed[block_cols]
+            keep = (cols != rows) & (~is_new[cols] | (cols > rows))
+            yield rows[keep], cols[keep], similarities[block_rows[keep], block_cols[keep]]
+
+    def _search_similarity_blocks(self, embeddings, block_size, mode, nodes=None):
+        """
+        Finds candidate pairs above the edge threshold by querying the FAISS index one row block at a time.
+        
+        In "range" mode every neighbor within the threshold radius is returned; in "knn" mode only the
+        knn_k nearest neighbors of each node are considered. Since the indexed vectors are unit length,
+        a squared L2 distance d maps to a cosine similarity of 1 - d / 2. Index rows are mapped to nodes
+        through row_chunk_ids.
+        
+        Args:
+        - embeddings (numpy.ndarray): An array of query embeddings.
+        - block_size (int): The number of rows searched per block.
+        - mode (str): Either "range" or "knn".
+        - nodes (numpy.ndarray, optional): The node of each query row. Defaults to the row numbers.
+        
+        Yields:
+        - tuple: A tuple containing:
+          - rows (numpy.ndarray): The first node of each candidate pair.
+          - cols (numpy.ndarray): The second node of each candidate pair.
+          - similarities (numpy.ndarray): The cosine similarity of each candidate pair.
+        """
+        index = self.vector_store.index
+        num_queries = embeddings.shape[0]
+        nodes = np.arange(num_queries) if nodes is None else np.asarray(nodes)
+        row_chunk_ids = np.asarray(self.row_chunk_ids)
+        radius = 2.0 * (1.0 - self.edges_threshold)
+        
+        for start in range(0, num_queries, block_size):
+            stop = min(start + block_size, num_queries)
+            queries = np.ascontiguousarray(embeddings[start:stop])
+            if mode == "range":
+                lims, distances, cols = index.range_search(queries, radius)
+                rows = np.repeat(nodes[start:stop], np.diff(lims).astype(np.int64))
+            else:
+                distances, cols = index.search(queries, min(self.knn_k + 1, index.ntotal))
+                rows = np.repeat(nodes[start:stop], cols.shape[1])
+                distances, cols = distances.ravel(), cols.ravel()
+            
+            cols = np.where(cols >= 0, row_chunk_ids[cols], -1)
+            similarities = 1.0 - distances / 2.0
+            keep = (cols >= 0) & (cols != rows) & (similarities > self.edges_threshold)
+            rows, cols, similarities = rows[keep], cols[keep], similarities[keep]
+            
+            # kNN results are not symmetric, so report every pair once as (smaller node, larger node)
+            pairs = np.unique(np.stack([np.minimum(rows, cols), np.maximum(rows, cols)]), axis=1, return_index=True)
+            (rows, cols), first = pairs
+            yield rows, cols, similarities[first]
+
+    def _candidate_pairs(self, embeddings, mode=None, nodes=None):
+        """
+        Yields blocks of candidate edges using the configured (or given) edge mode.
+        
+        When nodes is given, only pairs with at least one of those nodes are considered, by comparing them
+        against the indexed nodes. Otherwise all indexed nodes are compared, skipping the rows of retired nodes.
+        
+        Args:
+        - embeddings (numpy.ndarray): An array of embeddings, one row per node.
+        - mode (str, optional): "exact", "range" or "knn". Defaults to edge_mode.
+        - nodes (numpy.ndarray, optional): The new nodes of an incremental update. Defaults to all nodes.
+        
+        Returns:
+        - generator: Blocks of (rows, cols, similarities) arrays.
+        """
+        mode = mode or self.edge_mode
+        live = None
+        if nodes is None and len(self.row_chunk_ids) < embeddings.shape[0]:
+            live = np.asarray(self.row_chunk_ids)
+        if mode == "exact":
+            if nodes is not None:
+                return self._compute_new_node_blocks(nodes, self.edge_block_size)
+            if live is not None:
+                # row_chunk_ids is ascending, so the upper triangle over live rows maps to node1 < node2
+                return ((live[rows], live[cols], similarities)
+                        for rows, cols, similarities in self._compute_similarity_blocks(embeddings[live], self.edge_block_size))
+            return self._compute_similarity_blocks(embeddings, self.edge_block_size)
+        if mode in ("range", "knn"):
+            nodes = live if live is not None else nodes
+            queries = embeddings if nodes is None else embeddings[nodes]
+            return self._search_similarity_blocks(queries, self.edge_block_size, mode, nodes)
+        raise ValueError(f"Unknown edge mode: {mode}")
+
+    def edge_recall_report(self, modes=("range", "knn")):
+        """
+        Compares the candidate edges found by the approximate modes against the exact edge set.
+        
+        Args:
+        - modes (tuple of str, optional): The approximate modes to evaluate. Default is ("range", "knn").
+        
+        Returns:
+        - dict: For "exact" and each mode, the number of edges and the seconds taken; approximate
+          modes also report recall and precision against the exact edges.
+        """
+        num_nodes = self.embeddings.shape[0]
+        
+        def collect(mode):
+            start_time = time.perf_counter()
+            keys = [rows.astype(np.int64) * num_nodes + cols for rows, cols, _ in self._candidate_pairs(self.embeddings, mode)]
+            keys = np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+            return keys, time.perf_counter() - start_time
+        
+        exact_keys, exact_seconds = collect("exact")
+        report = {"exact": {"edges": len(exact_keys), "seconds": exact_seconds}}
+        for mode in modes:
+            keys, seconds = collect(mode)
+            found = len(np.intersect1d(exact_keys, keys, assume_unique=True))
+            report[mode] = {
+                "edges": len(keys),
+                "seconds": seconds,
+                "recall": found / len(exact_keys) if len(exact_keys) else 1.0,
+                "precision": found / len(keys) if len(keys) else 1.0,
+            }
+        return report
+
+    def _load_spacy_model(self):
+        """
+        Loads the spaCy NLP model, downloading it if necessary.
+        
+        Only doc.ents is read, so the components named entity recognition does not need are disabled.
+        
+        Args:
+        - None
+        
+        Returns:
+        - spacy.Language: An instance of a spaCy NLP model.
+        """
+        try:
+            return spacy.load("en_core_web_sm", disable=NER_DISABLED_PIPES)
+        except OSError:
+            print("Downloading spaCy model...")
+            download("en_core_web_sm")
+            return spacy.load("en_core_web_sm", disable=NER_DISABLED_PIPES)
+
+    def _extract_named_entities(self, contents):
+        """
+        Extracts named entities from a list of contents with spaCy's nlp.pipe.
+        
+        Documents are processed in batches of ner_batch_size and, if ner_n_process is greater than 1,
+        across several processes. The CPU time of this stage is recorded in build_stats; time spent in
+        worker processes is not included.
+        
+        Args:
+        - contents (list of str): The contents from which to extract named entities.
+        
+        Returns:
+        - list: One list of named entity strings per content.
+        """
+        start_time = time.perf_counter()
+        start_cpu_time = time.thread_time()
+        named_entities = [[ent.text for ent in doc.ents if ent.label_ in NAMED_ENTITY_LABELS]
+                          for doc in self.nlp.pipe(contents, batch_size=self.ner_batch_size, n_process=self.ner_n_process)]
+        cpu_seconds = time.thread_time() - start_cpu_time
+        self.build_stats.update({
+            'ner_seconds': time.perf_counter() - start_time,
+            'ner_cpu_seconds': cpu_seconds,
+            'ner_cpu_seconds_per_1k_chunks': 1000 * cpu_seconds / len(contents) if contents else 0.0,
+        })
+        return named_entities
+
+    def chunk_id(self, document):
+        """
+        Returns the graph node of a document retrieved from the vector store.
+        
+        Args:
+        - document (Document): A document carrying its chunk id in its metadata.
+        
+        Returns:
+        - int: The node id.
+        """
+        return int(document.metadata[CHUNK_ID_KEY])
+
+    def benchmark_node_lookup(self, documents, repeats=10):
+        """
+        Compares resolving retrieved documents to nodes by scanning node contents against the chunk id lookup.
+        
+        Args:
+        - documents (list of Document): Documents retrieved from the vector store.
+        - repeats (int): The number of times each resolution is repeated.
+        
+        Returns:
+        - dict: The milliseconds per resolution of the scan and of the lookup.
+        """
+        num_nodes = self.embeddings.shape[0]
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            for document in documents:
+                next(n for n in range(num_nodes) if self.node_content(n) == document.page_content)
+        scan_seconds = time.perf_counter() - start_time
+        
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            for document in documents:
+                self.chunk_id(document)
+        lookup_seconds = time.perf_counter() - start_time
+        
+        return {
+            'scan_ms': 1000 * scan_seconds / repeats,
+            'lookup_ms': 1000 * lookup_seconds / repeats,
+        }
+
+    def benchmark_named_entity_extraction(self, contents):
+        """
+        Compares the CPU time of per-document extraction with the full pipeline against the nlp.pipe stage.
+        
+        Args:
+        - contents (list of str): The contents to be processed.
+        
+        Returns:
+        - dict: The CPU seconds per 1k chunks of the per-document full pipeline and of the nlp.pipe stage.
+        """
+        disabled = list(self.nlp.disabled)
+        for name in disabled:
+            self.nlp.enable_pipe(name)
+        try:
+            start_cpu_time = time.thread_time()
+            for content in contents:
+                self.nlp(content)
+            per_document_seconds = time.thread_time() - start_cpu_time
+        finally:
+            for name in disabled:
+                self.nlp.disable_pipe(name)
+        
+        start_cpu_time = time.thread_time()
+        for _ in self.nlp.pipe(contents, batch_size=self.ner_batch_size, n_process=self.ner_n_process):
+            pass
+        pipe_seconds = time.thread_time() - start_cpu_time
+        
+        per_1k = 1000 / len(contents) if contents else 0.0
+        return {
+            'per_document_cpu_seconds_per_1k_chunks': per_document_seconds * per_1k,
+            'pipe_cpu_seconds_per_1k_chunks': pipe_seconds * per_1k,
+        }
+
+    def _extract_general_concepts(self, content, llm):
+        """
+        Extracts general concepts (excluding named entities) from the content using a large language model.
+        
+        Args:
+        - content (str): The content from which to extract concepts.
+        - llm: An instance of a large language model.
+        
+        Returns:
+        - list: A list of extracted concepts.
+        """
+        concept_extraction_prompt = PromptTemplate(
+            input_variables=["text"],
+            template=CONCEPT_EXTRACTION_TEMPLATE
+        )
+        concept_chain = concept_extraction_prompt | llm.with_structured_output(Concepts)
+        return concept_chain.invoke({"text": content}).concepts_list
+
+    async def _ainvoke_with_retry(self, chain, inputs, semaphore, stats):
+        """
+        Invokes a chain asynchronously, retrying transient errors with exponential backoff and full jitter.
+        
+        The semaphore bounds the number of requests in flight; it is not held while waiting to retry.
+        
+        Args:
+        - chain: The runnable chain to be invoked.
+        - inputs (dict): The inputs of the chain.
+        - semaphore (asyncio.Semaphore): The semaphore bounding concurrency.
+        - stats (dict): Counters of LLM calls and retries, updated in place.
+        
+        Returns:
+        - The chain's response.
+        """
+        for attempt in range(self.concept_max_retries + 1):
+            try:
+                async with semaphore:
+                    stats['llm_calls'] += 1
+                    return await chain.ainvoke(inputs)
+            except Exception as e:
+                if attempt == self.concept_max_retries or not is_retryable_error(e):
+                    raise
+                stats['retries'] += 1
+                delay = min(self.concept_backoff_max, self.concept_backoff_base * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+
+    async def _aextract_general_concepts(self, content, llm, semaphore, stats):
+        """
+        Asynchronously extracts general concepts from the content of a single chunk.
+        
+        Args:
+        - content (str): The content from which to extract concepts.
+        - llm: An instance of a large language model.
+        - semaphore (asyncio.Semaphore): The semaphore bounding concurrency.
+        - stats (dict): Counters of LLM calls, retries and prompt tokens, updated in place.
+        
+        Returns:
+        - list or None: A list of extracted concepts, or None if the call still failed after retries.
+        """
+        concept_extraction_prompt = PromptTemplate(input_variables=["text"], template=CONCEPT_EXTRACTION_TEMPLATE)
+        concept_chain = concept_extraction_prompt | llm.with_structured_output(Concepts)
+        stats['prompt_tokens'] += self._concept_prompt_tokens(content)
+        try:
+            response = await self._ainvoke_with_retry(concept_chain, {"text": content}, semaphore, stats)
+            return response.concepts_list
+        except Exception as e:
+            print(f"Concept extraction failed for a chunk, keeping its named entities only: {e}")
+            return None
+
+    async def _aextract_concepts_batch(self, nodes, contents, llm, semaphore, stats):
+        """
+        Asynchronously extracts general concepts for a batch of chunks with a single LLM call.
+        
+        Chunks missing from the response, or every chunk of a batch whose call fails, fall back to
+        per-chunk extraction.
+        
+        Args:
+        - nodes (list of int): The nodes whose chunks are extracted together.
+        - contents (dict): The content of every node, by node id.
+        - llm: An instance of a large language model.
+        - semaphore (asyncio.Semaphore): The semaphore bounding concurrency.
+        - stats (dict): Counters of LLM calls, retries and prompt tokens, updated in place.
+        
+        Returns:
+        - dict: A mapping of each node to its list of concepts, or to None if extraction failed.
+        """
+        general_concepts = {}
+        if len(nodes) > 1:
+            batch_prompt = PromptTemplate(input_variables=["chunks"], template=BATCH_CONCEPT_EXTRACTION_TEMPLATE)
+            chunks = "\n\n".join(f"[Chunk {node}]\n{contents[node]}" for node in nodes)
+            stats['prompt_tokens'] += count_tokens(batch_prompt.format(chunks=chunks))
+            try:
+                response = await self._ainvoke_with_retry(batch_prompt | llm.with_structured_output(BatchConcepts),
+                                                          {"chunks": chunks}, semaphore, stats)
+                general_concepts = {entry.chunk_id: entry.concepts_list for entry in response.chunks
+                                    if entry.chunk_id in nodes}
+            except Exception as e:
+                print(f"Batched concept extraction failed, falling back to per-chunk calls: {e}")
+        
+        fallback = [node for node in nodes if node not in general_concepts]
+        results = await asyncio.gather(*(self._aextract_general_concepts(contents[node], llm, semaphore, stats)
+                                         for node in fallback))
+        general_concepts.update(zip(fallback, results))
+        return general_concepts
+
+    async def _aextract_concepts(self, batches, contents, llm, stats):
+        """
+        Asynchronously extracts general concepts for all batches with at most concept_concurrency requests in flight.
+        
+        Args:
+        - batches (list): A list of batches, each a list of nodes.
+        - contents (dict): The content of every node, by node id.
+        - llm: An instance of a large language model.
+        - stats (dict): Counters updated in place.
+        
+        Returns:
+        - dict: A mapping of each node to its list of concepts, or to None if extraction failed.
+        """
+        semaphore = asyncio.Semaphore(self.concept_concurrency)
+        tasks = [self._aextract_concepts_batch(batch, contents, llm, semaphore, stats) for batch in batches]
+        general_concepts = {}
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Extracting concepts"):
+            general_concepts.update(await task)
+        return general_concepts
+
+    def _concept_prompt_tokens(self, content):
+        """
+        Counts the prompt tokens of a single-chunk concept extraction request.
+        
+        Args:
+        - content (str): The chunk content.
+        
+        Returns:
+        - int: The number of prompt tokens.
+        """
+        return count_tokens(CONCEPT_EXTRACTION_TEMPLATE.format(text=content))
+
+    def _pack_concept_batches(self, nodes, contents):
+        """
+        Greedily packs nodes into batches whose chunk text fits in the concept_batch_tokens budget.
+        
+        A chunk larger than the budget is placed in a batch of its own.
+        
+        Args:
+        - nodes (list of int): The nodes to be packed.
+        - contents (dict): The content of every node, by node id.
+        
+        Returns:
+        - list: A list of batches, each a list of nodes.
+        """
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for node in nodes:
+            tokens = count_tokens(contents[node])
+            if batch and (batch_tokens + tokens > self.concept_batch_tokens or len(batch) >= self.concept_batch_max_chunks):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(node)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _extract_concepts_batch(self, nodes, contents, llm):
+        """
+        Extracts general concepts for several chunks with a single structured-output LLM call.
+        
+        Chunks missing from the response, or every chunk of a batch whose response cannot be parsed,
+        fall back to per-chunk extraction.
+        
+        Args:
+        - nodes (list of int): The nodes whose chunks are extracted together.
+        - contents (dict): The content of every node, by node id.
+        - llm: An instance of a large language model.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - general_concepts (dict): A mapping of each node to its list of concepts.
+          - llm_calls (int): The number of LLM calls made.
+          - prompt_tokens (int): The number of prompt tokens sent, as counted locally.
+        """
+        if len(nodes) == 1:
+            node = nodes[0]
+            return {node: self._extract_general_concepts(contents[node], llm)}, 1, self._concept_prompt_tokens(contents[node])
+        
+        batch_prompt = PromptTemplate(input_variables=["chunks"], template=BATCH_CONCEPT_EXTRACTION_TEMPLATE)
+        chunks = "\n\n".join(f"[Chunk {node}]\n{contents[node]}" for node in nodes)
+        llm_calls = 1
+        prompt_tokens = count_tokens(batch_prompt.format(chunks=chunks))
+        try:
+            response = (batch_prompt | llm.with_structured_output(BatchConcepts)).invoke({"chunks": chunks})
+            general_concepts = {entry.chunk_id: entry.concepts_list for entry in response.chunks if entry.chunk_id in nodes}
+        except Exception as e:
+            print(f"Batched concept extraction failed, falling back to per-chunk calls: {e}")
+            general_concepts = {}
+        
+        for node in nodes:
+            if node not in general_concepts:
+                general_concepts[node] = self._extract_general_concepts(contents[node], llm)
+                llm_calls += 1
+                prompt_tokens += self._concept_prompt_tokens(contents[node])
+        return general_concepts, llm_calls, prompt_tokens
+
+    def _extract_concepts(self, splits, llm, nodes=None):
+        """
+        Extracts concepts and named entities for all document splits.
+        
+        Named entities are extracted in a separate CPU stage with nlp.pipe, running in a worker thread
+        while the I/O-bound LLM stage extracts general concepts, concurrently with asyncio or a thread pool.
+        Chunks not yet in the concept cache are packed into multi-chunk requests (see concept_batch_tokens).
+        The calls and prompt tokens saved compared to one request per chunk are recorded in build_stats.
+        
+        Args:
+        - splits (list): A list of document splits.
+        - llm: An instance of a large language model.
+        - nodes (list of int, optional): The node of each split. Defaults to the split indices.
+        
+        Returns:
+        - None
+        """
+        nodes = range(len(splits)) if nodes is None else nodes
+        contents = {node: split.page_content for node, split in zip(nodes, splits)}
+        model_name = getattr(llm, 'model_name', None) or getattr(llm, 'model', '')
+        cache_keys = {node: ConceptCache.make_key(content, model_name, CONCEPT_PROMPT_VERSION) for node, content in contents.items()}
+        cache_hits, cache_misses = self.concept_cache.hits, self.concept_cache.misses
+        pending = []
+        for node, key in cache_keys.items():
+            cached_concepts = self.concept_cache.get(key)
+            if cached_concepts is None:
+                pending.append(node)
+            else:
+                self.graph.nodes[node]['concepts'] = cached_concepts
+        
+        if self.concept_batch_tokens:
+            batches = self._pack_concept_batches(pending, contents)
+        else:
+            batches = [[node] for node in pending]
+        
+        stats = {'llm_calls': 0, 'retries': 0, 'prompt_tokens': 0}
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=1) as ner_executor:
+            ner_future = ner_executor.submit(self._extract_named_entities, [contents[node] for node in pending])
+            
+            if self.async_concept_extraction:
+                general_concepts = run_coroutine(self._aextract_concepts(batches, contents, llm, stats))
+            else:
+                general_concepts = {}
+                with ThreadPoolExecutor() as executor:
+                    futures = [executor.submit(self._extract_concepts_batch, batch, contents, llm) for batch in batches]
+                    
+                    for future in tqdm(as_completed(futures), total=len(futures), desc="Extracting concepts"):
+                        batch_concepts, batch_calls, batch_tokens = future.result()
+                        general_concepts.update(batch_concepts)
+                        stats['llm_calls'] += batch_calls
+                        stats['prompt_tokens'] += batch_tokens
+            named_entities = ner_future.result()
+        
+        failed_nodes = []
+        new_cache_entries = []
+        for node, entities in zip(pending, named_entities):
+            if general_concepts[node] is None:
+                # Keep the named entities but leave the chunk out of the cache so the next build retries it
+                failed_nodes.append(node)
+                self.graph.nodes[node]['concepts'] = list(set(entities))
+            else:
+                all_concepts = list(set(entities + general_concepts[node]))
+                new_cache_entries.append((cache_keys[node], all_concepts))
+                self.graph.nodes[node]['concepts'] = all_concepts
+        self.concept_cache.set_many(new_cache_entries)
+        
+        unbatched_tokens = sum(self._concept_prompt_tokens(contents[node]) for node in pending)
+        self.build_stats.update({
+            'concept_cache_hits': self.concept_cache.hits - cache_hits,
+            'concept_cache_misses': self.concept_cache.misses - cache_misses,
+            'concept_llm_calls': stats['llm_calls'],
+            'concept_llm_calls_saved': len(pending) - stats['llm_calls'],
+            'concept_llm_retries': stats['retries'],
+            'concept_failed_nodes': failed_nodes,
+            'concept_prompt_tokens': stats['prompt_tokens'],
+            'concept_prompt_tokens_saved': unbatched_tokens - stats['prompt_tokens'],
+            'concept_seconds': time.perf_counter() - start_time,
+        })
+
+    def _build_concept_incidence(self, nodes=None):
+        """
+        Interns the lemmatized concepts of every node and builds the node-by-concept incidence matrix.
+        
+        Args:
+        - nodes (list of int, optional): The nodes whose rows are built. Defaults to all nodes.
+        
+        Returns:
+        - scipy.sparse.csr_matrix: A binary matrix with a 1 where a node mentions a concept, one row per node.
+        """
+        concept_id_of = {}  # Raw concept string -> interned id, so each distinct string is lemmatized once
+        indptr = [0]
+        indices = []
+        
+        for node in (range(len(self.graph.nodes)) if nodes is None else nodes):
+            node_concept_ids = set()
+            for concept in self.graph.nodes[node]['concepts']:
+                if concept not in concept_id_of:
+                    lemma = self._lemmatize_concept(concept)
+                    concept_id_of[concept] = self.concept_ids.setdefault(lemma, len(self.concept_ids))
+                node_concept_ids.add(concept_id_of[concept])
+            indices.extend(sorted(node_concept_ids))
+            indptr.append(len(indices))
+        
+        data = np.ones(len(indices), dtype=np.float32)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(self.concept_ids)))
+
+    def _add_edges(self, embeddings, nodes=None):
+        """
+        Adds edges to the graph based on the similarity of embeddings and shared concepts.
+        
+        Candidate pairs are found block by block, either exactly with NumPy or through the FAISS index
+        (see edge_mode). Shared-concept counts for each block come from one sparse product over the
+        concept incidence matrix, and edge weights are computed in bulk. Edges store only the
+        similarity, the shared-concept count and the weight. A pair found from both of its nodes is added once.
+        
+        Args:
+        - embeddings (numpy.ndarray): An array of embeddings for the document splits.
+        - nodes (numpy.ndarray, optional): The new nodes of an incremental update, whose edges are added. Defaults to all nodes.
+        
+        Returns:
+        - tuple: The (sources, targets, weights, similarities, shared_concept_counts) arrays of the added edges.
+        """
+        num_nodes = len(self.graph.nodes) if nodes is None else len(nodes)
+        incidence = self.concept_incidence
+        concept_counts = np.diff(incidence.indptr)
+        num_blocks = -(-num_nodes // self.edge_block_size)
+        blocks = [(np.minimum(rows, cols), np.maximum(rows, cols), similarities)
+                  for rows, cols, similarities in tqdm(self._candidate_pairs(embeddings, nodes=nodes), total=num_blocks, desc="Adding edges")]
+        if blocks:
+            rows, cols, similarities = (np.concatenate(arrays) for arrays in zip(*blocks))
+        else:
+            rows, cols, similarities = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        _, first = np.unique(rows.astype(np.int64) * self.embeddings.shape[0] + cols, return_index=True)
+        rows, cols, similarities = rows[first].astype(np.int64), cols[first].astype(np.int64), similarities[first]
+        
+        shared_counts = np.asarray(incidence[rows].multiply(incidence[cols]).sum(axis=1)).ravel().astype(np.int64)
+        max_possible_shared = np.minimum(concept_counts[rows], concept_counts[cols])
+        edge_weights = self._calculate_edge_weights(similarities, shared_counts, max_possible_shared)
+        
+        self.graph.add_edges_from(
+            (node1, node2, {'weight': weight, 'similarity': similarity, 'shared_concept_count': shared})
+            for node1, node2, weight, similarity, shared in zip(rows.tolist(), cols.tolist(), edge_weights.tolist(),
+                                                                 similarities.tolist(), shared_counts.tolist())
+        )
+        return rows, cols, edge_weights, similarities.astype(np.float32), shared_counts.astype(np.int32)
+
+    def _calculate_edge_weights(self, similarity_scores, shared_counts, max_possible_shared, alpha=0.7, beta=0.3):
+        """
+        Calculates the weights of a batch of edges based on similarity scores and shared concepts.
+        
+        Args:
+        - similarity_scores (numpy.ndarray): The similarity score of each node pair.
+        - shared_counts (numpy.ndarray): The number of concepts shared by each node pair.
+        - max_possible_shared (numpy.ndarray): The smaller concept count of the two nodes in each pair.
+        - alpha (float, optional): The weight of the similarity score. Default is 0.7.
+        - beta (float, optional): The weight of the shared concepts. Default is 0.3.
+        
+        Returns:
+        - numpy.ndarray: The calculated weight of each edge.
+        """
+        normalized_shared_concepts = np.divide(shared_counts, max_possible_shared,
+                                               out=np.zeros(len(shared_counts), dtype=np.float64),
+                                               where=max_possible_shared > 0)
+        return alpha * similarity_scores.astype(np.float64) + beta * normalized_shared_concepts
+
+    def node_content(self, node):
+        """
+        Returns the content of a node without building the networkx graph of a loaded snapshot.
+        
+        Args:
+        - node (int): The node id.
+        
+        Returns:
+        - str: The chunk text of the node.
+        """
+        if self._graph is None:
+            return self.chunk_store[node]
+        return self._graph.nodes[node]['content'] if node in self._graph else ""  # Retired nodes have no content
+
+    def node_concepts(self, node):
+        """
+        Returns the concepts of a node without building the networkx graph of a loaded snapshot.
+        
+        Args:
+        - node (int): The node id.
+        
+        Returns:
+        - list: The concepts and entities of the node.
+        """
+        if self._graph is None:
+            concepts = self.concept_store[node]
+            return concepts.split("\x1f") if concepts else []
+        return self._graph.nodes[node]['concepts'] if node in self._graph else []
+
+    def node_metadata(self, node):
+        """
+        Returns the metadata of a node's chunk, such as its source file and page.
+        
+        Args:
+        - node (int): The node id.
+        
+        Returns:
+        - dict: The metadata of the chunk, including its chunk id.
+        """
+        if self.metadata_store is not None and self._graph is None:
+            return json.loads(self.metadata_store[node])
+        document = self.vector_store.docstore.search(str(node))
+        return document.metadata if isinstance(document, Document) else {}  # Retired nodes have no document
 
-    def _add_nodes(self, splits):
+    def _edge_arrays(self):
         """
-        Adds nodes to the graph from the document splits.
+        Returns the edges as compact arrays, extracting them from the networkx graph on first use.
         
         Args:
-        - splits (list): A list of document splits.
+        - None
         
         Returns:
-        - None
+        - tuple: The (sources, targets, weights, similarities, shared_concept_counts) arrays.
         """
-        for i, split in enumerate(splits):
-            self.graph.add_node(i, content=split.page_content)
+        if self._edges is None:
+            edges = list(self._graph.edges(data=True))
+            self._edges = (
+                np.array([u for u, _, _ in edges], dtype=np.int64),
+                np.array([v for _, v, _ in edges], dtype=np.int64),
+                np.array([data['weight'] for _, _, data in edges], dtype=np.float64),
+                np.array([data['similarity'] for _, _, data in edges], dtype=np.float32),
+                np.array([data['shared_concept_count'] for _, _, data in edges], dtype=np.int32),
+            )
+        return self._edges
 
-    def _create_embeddings(self, splits, embedding_model):
+    def adjacency(self):
         """
-        Creates embeddings for the document splits using the embedding model.
+        Returns the symmetric edge-weight matrix of the graph as a CSR matrix, building it on first use.
         
         Args:
-        - splits (list): A list of document splits.
-        - embedding_model: An instance of an embedding model.
+        - None
         
         Returns:
-        - numpy.ndarray: An array of embeddings for the document splits.
+        - scipy.sparse.csr_matrix: A (num_nodes, num_nodes) matrix of edge weights.
         """
-        texts = [split.page_content for split in splits]
-        return embedding_model.embed_documents(texts)
-
-    def _compute_similarities(self, embeddings):
+        if self._adjacency is None:
+            sources, targets, weights, _, _ = self._edge_arrays()
+            num_nodes = self.embeddings.shape[0]
+            self._adjacency = sparse.csr_matrix(
+                (np.concatenate([weights, weights]), (np.concatenate([sources, targets]), np.concatenate([targets, sources]))),
+                shape=(num_nodes, num_nodes))
+        return self._adjacency
+
+    def transition_matrix(self):
         """
-        Computes the cosine similarity matrix for the embeddings.
+        Returns the random-walk transition matrix of the graph, building it on first use.
+        
+        Each row holds the edge weights of a node divided by their sum; nodes without edges have empty rows.
         
         Args:
-        - embeddings (numpy.ndarray): An array of embeddings.
+        - None
         
         Returns:
-        - numpy.ndarray: A cosine similarity matrix for the embeddings.
+        - scipy.sparse.csr_matrix: A (num_nodes, num_nodes) row-stochastic matrix.
         """
-        return cosine_similarity(embeddings)
-
-    def _load_spacy_model(self):
+        if self._transition is None:
+            adjacency = self.adjacency()
+            out_weights = np.asarray(adjacency.sum(axis=1)).ravel()
+            inverse = np.divide(1.0, out_weights, out=np.zeros_like(out_weights), where=out_weights > 0)
+            self._transition = sparse.diags(inverse).dot(adjacency).tocsr()
+        return self._transition
+
+    def distance_matrix(self):
         """
-        Loads the spaCy NLP model, downloading it if necessary.
+        Returns the edge distances (1 / weight) of the graph as a CSR matrix, building it on first use.
+        
+        Stronger connections are shorter, matching the distances used by the query traversal.
         
         Args:
         - None
         
         Returns:
-        - spacy.Language: An instance of a spaCy NLP model.
+        - scipy.sparse.csr_matrix: A (num_nodes, num_nodes) matrix of edge distances.
         """
-        try:
-            return spacy.load("en_core_web_sm")
-        except OSError:
-            print("Downloading spaCy model...")
-            download("en_core_web_sm")
-            return spacy.load("en_core_web_sm")
+        if self._distances is None:
+            adjacency = self.adjacency()
+            self._distances = sparse.csr_matrix((1.0 / adjacency.data, adjacency.indices, adjacency.indptr),
+                                                shape=adjacency.shape)
+        return self._distances
 
-    def _extract_concepts_and_entities(self, content, llm):
+    def shortest_path_order(self, seeds, seed_distances, limit=np.inf):
         """
-        Extracts concepts and named entities from the content using spaCy and a large language model.
+        Orders the nodes reachable from the seeds by their shortest distance, computed in one csgraph call.
         
         Args:
-        - content (str): The content from which to extract concepts and entities.
-        - llm: An instance of a large language model.
+        - seeds (list of int): The seed nodes.
+        - seed_distances (array-like): The starting distance of each seed node.
+        - limit (float): The maximum path length explored from a seed.
         
         Returns:
-        - list: A list of extracted concepts and entities.
+        - tuple: A tuple containing:
+          - nodes (numpy.ndarray): The reachable nodes, by increasing distance.
+          - distances (numpy.ndarray): The distance of each of those nodes.
+        """
+        path_lengths = csgraph.dijkstra(self.distance_matrix(), directed=False, indices=seeds, limit=limit)
+        distances = (path_lengths + np.asarray(seed_distances, dtype=np.float64)[:, None]).min(axis=0)
+        nodes = np.flatnonzero(np.isfinite(distances))
+        nodes = nodes[np.argsort(distances[nodes], kind="stable")]
+        return nodes, distances[nodes]
+
+    def personalized_pagerank(self, seeds, seed_weights, alpha=0.85, max_iter=50, tol=1e-6):
         """
-        if content in self.concept_cache:
-            return self.concept_cache[content]
+        Runs Personalized PageRank with restarts to the seed nodes by power iteration.
         
-        # Extract named entities using spaCy
-        doc = self.nlp(content)
-        named_entities = [ent.text for ent in doc.ents if ent.label_ in ["PERSON", "ORG", "GPE", "WORK_OF_ART"]]
+        Args:
+        - seeds (list of int): The seed nodes.
+        - seed_weights (array-like): The restart weight of each seed node.
+        - alpha (float): The probability of following an edge instead of restarting.
+        - max_iter (int): The maximum number of iterations.
+        - tol (float): The L1 change below which the iteration stops.
         
-        # Extract general concepts using LLM
-        concept_extraction_prompt = PromptTemplate(
-            input_variables=["text"],
-            template="Extract key concepts (excluding named entities) from the following text:\n\n{text}\n\nKey concepts:"
-        )
-        concept_chain = concept_extraction_prompt | llm.with_structured_output(Concepts)
-        general_concepts = concept_chain.invoke({"text": content}).concepts_list
+        Returns:
+        - numpy.ndarray: The PageRank score of every node.
+        """
+        transition_t = self.transition_matrix().T.tocsr()
+        dangling = np.asarray(self.transition_matrix().sum(axis=1)).ravel() == 0
+        restart = np.zeros(transition_t.shape[0])
+        np.add.at(restart, seeds, seed_weights)
+        restart /= restart.sum()
+        
+        scores = restart.copy()
+        for _ in range(max_iter):
+            # Walks reaching a node without edges restart at the seeds
+            updated = alpha * transition_t.dot(scores) + (alpha * scores[dangling].sum() + 1 - alpha) * restart
+            if np.abs(updated - scores).sum() < tol:
+                return updated
+            scores = updated
+        return scores
+
+    def neighbors(self, node):
+        """
+        Returns the neighbors of a node together with the weights of the connecting edges.
         
-        # Combine named entities and general concepts
-        all_concepts = list(set(named_entities + general_concepts))
+        Args:
+        - node (int): The node id.
         
-        self.concept_cache[content] = all_concepts
-        return all_concepts
+        Returns:
+        - list: A list of (neighbor, edge_weight) tuples.
+        """
+        adjacency = self.adjacency()
+        start, stop = adjacency.indptr[node], adjacency.indptr[node + 1]
+        return list(zip(adjacency.indices[start:stop].tolist(), adjacency.data[start:stop].tolist()))
 
-    def _extract_concepts(self, splits, llm):
+    def _materialize_graph(self):
         """
-        Extracts concepts for all document splits using multi-threading.
+        Builds the networkx graph of a loaded snapshot from its stores and edge arrays, leaving out retired nodes.
         
         Args:
-        - splits (list): A list of document splits.
-        - llm: An instance of a large language model.
+        - None
         
         Returns:
-        - None
+        - networkx.Graph: The knowledge graph.
         """
-        with ThreadPoolExecutor() as executor:
-            future_to_node = {executor.submit(self._extract_concepts_and_entities, split.page_content, llm): i 
-                              for i, split in enumerate(splits)}
-            
-            for future in tqdm(as_completed(future_to_node), total=len(splits), desc="Extracting concepts and entities"):
-                node = future_to_node[future]
-                concepts = future.result()
-                self.graph.nodes[node]['concepts'] = concepts
+        graph = nx.Graph()
+        def node_attributes(node):
+            metadata = json.loads(self.metadata_store[node])
+            return {'content': self.chunk_store[node], 'concepts': self.node_concepts(node),
+                    'source': metadata.get('source'), 'page': metadata.get('page')}
+        
+        graph.add_nodes_from((node, node_attributes(node)) for node in sorted(self.row_chunk_ids.tolist()))
+        sources, targets, weights, similarities, shared_counts = self._edges
+        graph.add_edges_from(
+            (u, v, {'weight': weight, 'similarity': similarity, 'shared_concept_count': shared})
+            for u, v, weight, similarity, shared in zip(sources.tolist(), targets.tolist(), weights.tolist(),
+                                                         similarities.tolist(), shared_counts.tolist())
+        )
+        return graph
 
-    def _add_edges(self, embeddings):
+    def save(self, path):
         """
-        Adds edges to the graph based on the similarity of embeddings and shared concepts.
+        Writes a versioned snapshot of the knowledge graph and its vector store to a directory.
+        
+        The snapshot holds the FAISS index, the embedding matrix, the edges as compact arrays, the concept
+        incidence matrix and string stores of chunk texts, concepts and metadata. It is written next to
+        the target and moved into place once complete.
         
         Args:
-        - embeddings (numpy.ndarray): An array of embeddings for the document splits.
+        - path (str): The snapshot directory.
         
         Returns:
         - None
         """
-        similarity_matrix = self._compute_similarities(embeddings)
-        num_nodes = len(self.graph.nodes)
+        num_nodes = self.embeddings.shape[0]
+        temporary_path = path.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        os.makedirs(temporary_path)
+        
+        np.save(os.path.join(temporary_path, "embeddings.npy"), self.embeddings)
+        np.save(os.path.join(temporary_path, "row_chunk_ids.npy"), self.row_chunk_ids)
+        np.save(os.path.join(temporary_path, "token_counts.npy"), self.token_counts)
+        if self.sentence_embeddings is not None:
+            np.save(os.path.join(temporary_path, "sentence_embeddings.npy"), self.sentence_embeddings)
+            np.save(os.path.join(temporary_path, "sentence_offsets.npy"), self.sentence_offsets)
+        for name, array in zip(["edge_sources", "edge_targets", "edge_weights", "edge_similarities", "edge_shared_counts"],
+                               self._edge_arrays()):
+            np.save(os.path.join(temporary_path, f"{name}.npy"), array)
+        np.save(os.path.join(temporary_path, "incidence_indptr.npy"), self.concept_incidence.indptr.astype(np.int64))
+        np.save(os.path.join(temporary_path, "incidence_indices.npy"), self.concept_incidence.indices.astype(np.int32))
+        
+        StringStore.write(os.path.join(temporary_path, "chunks"), (self.node_content(node) for node in range(num_nodes)))
+        StringStore.write(os.path.join(temporary_path, "concepts"),
+                          ("\x1f".join(self.node_concepts(node)) for node in range(num_nodes)))
+        StringStore.write(os.path.join(temporary_path, "metadata"),
+                          (json.dumps(self.node_metadata(node)) for node in range(num_nodes)))
+        faiss.write_index(self.vector_store.index, os.path.join(temporary_path, "index.faiss"))
+        
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'num_nodes': num_nodes,
+            'num_edges': len(self._edge_arrays()[0]),
+            'version': self.version,
+            'concepts': sorted(self.concept_ids, key=self.concept_ids.get),
+            'settings': {'edges_threshold': self.edges_threshold, 'edge_mode': self.edge_mode, 'knn_k': self.knn_k,
+                         'index_factory': self.index_factory},
+        }
+        with open(os.path.join(temporary_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
         
-        for node1 in tqdm(range(num_nodes), desc="Adding edges"):
-            for node2 in range(node1 + 1, num_nodes):
-                similarity_score = similarity_matrix[node1][node2]
-                if similarity_score > self.edges_threshold:
-                    shared_concepts = set(self.graph.nodes[node1]['concepts']) & set(self.graph.nodes[node2]['concepts'])
-                    edge_weight = self._calculate_edge_weight(node1, node2, similarity_score, shared_concepts)
-                    self.graph.add_edge(node1, node2, weight=edge_weight, 
-                                        similarity=similarity_score,
-                                        shared_concepts=list(shared_concepts))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temporary_path, path)
 
-    def _calculate_edge_weight(self, node1, node2, similarity_score, shared_concepts, alpha=0.7, beta=0.3):
+    @classmethod
+    def load(cls, path, embedding_model):
         """
-        Calculates the weight of an edge based on similarity score and shared concepts.
+        Opens a snapshot written by save, memory-mapping its large arrays.
+        
+        Chunk texts, concepts and metadata are decoded only when accessed, and the networkx graph is
+        built only when the graph attribute is first used.
         
         Args:
-        - node1 (int): The first node.
-        - node2 (int): The second node.
-        - similarity_score (float): The similarity score between the nodes.
-        - shared_concepts (set): The set of shared concepts between the nodes.
-        - alpha (float, optional): The weight of the similarity score. Default is 0.7.
-        - beta (float, optional): The weight of the shared concepts. Default is 0.3.
+        - path (str): The snapshot directory.
+        - embedding_model: An instance of an embedding model, used by the vector store to embed queries.
         
         Returns:
-        - float: The calculated weight of the edge.
+        - KnowledgeGraph: The loaded knowledge graph.
         """
-        max_possible_shared = min(len(self.graph.nodes[node1]['concepts']), len(self.graph.nodes[node2]['concepts']))
-        normalized_shared_concepts = len(shared_concepts) / max_possible_shared if max_possible_shared > 0 else 0
-        return alpha * similarity_score + beta * normalized_shared_concepts
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest['format_version'] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version: {manifest['format_version']}")
+        
+        knowledge_graph = cls()
+        knowledge_graph.version = manifest['version']
+        for name, value in manifest['settings'].items():
+            setattr(knowledge_graph, name, value)
+        
+        def load_array(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+        
+        num_nodes = manifest['num_nodes']
+        knowledge_graph.embeddings = load_array("embeddings")
+        knowledge_graph.row_chunk_ids = load_array("row_chunk_ids")
+        knowledge_graph.token_counts = load_array("token_counts")
+        if os.path.exists(os.path.join(path, "sentence_embeddings.npy")):
+            knowledge_graph.sentence_embeddings = load_array("sentence_embeddings")
+            knowledge_graph.sentence_offsets = load_array("sentence_offsets")
+        knowledge_graph._edges = tuple(load_array(name) for name in
+                                       ["edge_sources", "edge_targets", "edge_weights", "edge_similarities", "edge_shared_counts"])
+        indices = load_array("incidence_indices")
+        knowledge_graph.concept_incidence = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, load_array("incidence_indptr")),
+            shape=(num_nodes, len(manifest['concepts'])))
+        knowledge_graph.concept_ids = {concept: i for i, concept in enumerate(manifest['concepts'])}
+        
+        knowledge_graph.chunk_store = StringStore.open(os.path.join(path, "chunks"))
+        knowledge_graph.concept_store = StringStore.open(os.path.join(path, "concepts"))
+        knowledge_graph.metadata_store = StringStore.open(os.path.join(path, "metadata"))
+        
+        index = faiss.read_index(os.path.join(path, "index.faiss"), faiss.IO_FLAG_MMAP)
+        docstore = ChunkDocstore(knowledge_graph.chunk_store, knowledge_graph.metadata_store)
+        index_to_docstore_id = {row: str(chunk_id) for row, chunk_id in enumerate(knowledge_graph.row_chunk_ids.tolist())}
+        knowledge_graph.vector_store = FAISS(embedding_model, index, docstore, index_to_docstore_id)
+        knowledge_graph.graph = None
+        return knowledge_graph
 
     def _lemmatize_concept(self, concept):
         """
@@ -318,8 +1689,26 @@ class QueryEngine:
         self.vector_store = vector_store
         self.knowledge_graph = knowledge_graph
         self.llm = llm
-        self.max_context_length = 4000
+        self.max_context_length = 4000  # Token budget of the context passed to the LLM
+        self.retrieval_k = 5
+        self.compression_mode = "local"  # "local" keeps the sentences closest to the query, "llm" uses LLMChainExtractor
+        self.compression_top_sentences = 3
+        self.check_policy = "every_node"
+        self.check_every_k = 3
+        self.check_token_delta = 1000
+        self.ppr_alpha = 0.85
+        self.distance_limit = np.inf
+        self.beam_width = 4
+        self.max_hops = 3
+        self.fan_out = 8
+        self.novelty_weight = 0.5
+        self.ppr_top_n = 20
         self.answer_check_chain = self._create_answer_check_chain()
+        self.compressor = LLMChainExtractor.from_llm(self.llm)
+        self.last_query_stats = {}
+        self.use_answer_cache = True
+        self.answer_cache = SemanticAnswerCache()
+        self._step_listener = None
 
     def _create_answer_check_chain(self):
         """
@@ -331,11 +1720,11 @@ class QueryEngine:
         Returns:
         - Chain: A chain to check if the context provides a complete answer.
         """
-        answer_check_prompt = PromptTemplate(
+        self.answer_check_prompt = PromptTemplate(
             input_variables=["query", "context"],
             template="Given the query: '{query}'\n\nAnd the current context:\n{context}\n\nDoes this context provide a complete answer to the query? If yes, provide the answer. If no, state that the answer is incomplete.\n\nIs complete answer (Yes/No):\nAnswer (if complete):"
         )
-        return answer_check_prompt | self.llm.with_structured_output(AnswerCheck)
+        return self.answer_check_prompt | self.llm.with_structured_output(AnswerCheck)
 
     def _check_answer(self, query: str, context: str) -> Tuple[bool, str]:
         """
@@ -350,12 +1739,56 @@ class QueryEngine:
           - is_complete (bool): Whether the context provides a complete answer.
           - answer (str): The answer based on the context, if complete.
         """
-        response = self.answer_check_chain.invoke({"query": query, "context": context})
+        input_data = {"query": query, "context": context}
+        self._record_llm_call(self.answer_check_prompt.format(**input_data), check=True)
+        response = self.answer_check_chain.invoke(input_data)
         return response.is_complete, response.answer
 
-  
+    def _should_check_answer(self, nodes_since_check, tokens_since_check):
+        """
+        Decides whether to check for a complete answer after adding a node, according to check_policy.
+        
+        Policies:
+        - "every_node": Check after every added node.
+        - "every_k": Check once check_every_k nodes were added since the last check.
+        - "token_delta": Check once check_token_delta tokens of context were added since the last check.
+        - "end": Never check during the traversal; the answer is generated once from the final context.
+        
+        Args:
+        - nodes_since_check (int): The number of nodes added since the last check.
+        - tokens_since_check (int): The number of context tokens added since the last check.
+        
+        Returns:
+        - bool: Whether to check now.
+        """
+        if self.check_policy == "every_node":
+            return True
+        if self.check_policy == "every_k":
+            return nodes_since_check >= self.check_every_k
+        if self.check_policy == "token_delta":
+            return tokens_since_check >= self.check_token_delta
+        if self.check_policy == "end":
+            return False
+        raise ValueError(f"Unknown check policy: {self.check_policy}")
+
+    def _record_llm_call(self, prompt, check=False):
+        """
+        Adds an LLM call and its prompt tokens, counted with the local tokenizer, to the current query's statistics.
+        
+        Args:
+        - prompt (str): The prompt sent to the LLM.
+        - check (bool): Whether the call is a completeness check.
+        
+        Returns:
+        - None
+        """
+        self.last_query_stats['llm_calls'] = self.last_query_stats.get('llm_calls', 0) + 1
+        self.last_query_stats['prompt_tokens'] = self.last_query_stats.get('prompt_tokens', 0) + count_tokens(prompt)
+        if check:
+            self.last_query_stats['check_calls'] = self.last_query_stats.get('check_calls', 0) + 1
+
 
-    def _expand_context(self, query: str, relevant_docs) -> Tuple[str, List[int], Dict[int, str], str]:
+    def _expand_context(self, query: str, relevant_docs, query_vector) -> Tuple[str, List[int], Dict[int, str], str]:
         """
         Expands the context by traversing the knowledge graph using a Dijkstra-like approach.
         
@@ -378,7 +1811,9 @@ class QueryEngine:
 
         4. Termination:
            - Stop if a complete answer is found.
-           - Continue until the priority queue is empty (all reachable nodes explored).
+           - Stop once the next node does not fit in the max_context_length token budget; neighbors that
+             do not fit are dropped, since they rank below the nodes already in the context.
+           - Otherwise continue until the priority queue is empty (all reachable nodes explored).
 
         This approach ensures that:
         - We prioritize the most relevant and strongly connected information.
@@ -388,16 +1823,18 @@ class QueryEngine:
         Args:
         - query (str): The query to be answered.
         - relevant_docs (List[Document]): A list of relevant documents to start the traversal.
+        - query_vector (numpy.ndarray): The normalized query embedding, used to score the starting nodes.
 
         Returns:
         - tuple: A tuple containing:
           - expanded_context (str): The accumulated context from traversed nodes.
           - traversal_path (List[int]): The sequence of node indices visited.
           - filtered_content (Dict[int, str]): A mapping of node indices to their content.
-          - final_answer (str): The final answer found, if any.
+          - final_answer (str): The final answer found, if any; otherwise it is generated from the context by the caller.
         """
         # Initialize variables
-        expanded_context = ""
+        context_chunks = []
+        context_tokens = 0
         traversal_path = []
         visited_concepts = set()
         filtered_content = {}
@@ -408,21 +1845,18 @@ class QueryEngine:
         
         print("\nTraversing the knowledge graph:")
         
-        # Initialize priority queue with closest nodes from relevant docs
-        for doc in relevant_docs:
-            # Find the most similar node in the knowledge graph for each relevant document
-            closest_nodes = self.vector_store.similarity_search_with_score(doc.page_content, k=1)
-            closest_node_content, similarity_score = closest_nodes[0]
-            
-            # Get the corresponding node in our knowledge graph
-            closest_node = next(n for n in self.knowledge_graph.graph.nodes if self.knowledge_graph.graph.nodes[n]['content'] == closest_node_content.page_content)
-            
+        # Initialize priority queue with the nodes of the relevant docs, whose chunk ids survive compression
+        seed_nodes = list(dict.fromkeys(self.knowledge_graph.chunk_id(doc) for doc in relevant_docs))
+        seed_similarities = np.asarray(self.knowledge_graph.embeddings[seed_nodes]) @ query_vector if seed_nodes else []
+        for seed_node, similarity_score in zip(seed_nodes, np.maximum(seed_similarities, 1e-6).tolist()):
             # Initialize priority (inverse of similarity score for min-heap behavior)
             priority = 1 / similarity_score
-            heapq.heappush(priority_queue, (priority, closest_node))
-            distances[closest_node] = priority
+            heapq.heappush(priority_queue, (priority, seed_node))
+            distances[seed_node] = priority
         
         step = 0
+        nodes_since_check = 0
+        tokens_since_check = 0
         while priority_queue:
             # Get the node with the highest priority (lowest distance value)
             current_priority, current_node = heapq.heappop(priority_queue)
@@ -432,26 +1866,36 @@ class QueryEngine:
                 continue
             
             if current_node not in traversal_path:
+                # Stop once the token budget is reached
+                node_tokens = int(self.knowledge_graph.token_counts[current_node])
+                if context_tokens + node_tokens > self.max_context_length:
+                    self.last_query_stats['budget_reached'] = True
+                    break
+                
                 step += 1
                 traversal_path.append(current_node)
-                node_content = self.knowledge_graph.graph.nodes[current_node]['content']
-                node_concepts = self.knowledge_graph.graph.nodes[current_node]['concepts']
+                self.last_query_stats.setdefault('first_step_seconds', time.perf_counter() - self._query_start_time)
+                node_content = self.knowledge_graph.node_content(current_node)
+                node_concepts = self.knowledge_graph.node_concepts(current_node)
                 
                 # Add node content to our accumulated context
                 filtered_content[current_node] = node_content
-                expanded_context += "\n" + node_content if expanded_context else node_content
+                context_chunks.append(node_content)
+                context_tokens += node_tokens
                 
                 # Log the current step for debugging and visualization
-                st.write(f"<span style='color:red;'>Step {step} - Node {current_node}:</span>", unsafe_allow_html=True)
-                st.write(f"Content: {node_content[:100]}...") 
-                st.write(f"Concepts: {', '.join(node_concepts)}")
+                self._report_step(step, current_node, node_content, concepts=node_concepts)
                 print("-" * 50)
                 
-                # Check if we have a complete answer with the current context
-                is_complete, answer = self._check_answer(query, expanded_context)
-                if is_complete:
-                    final_answer = answer
-                    break
+                # Check if we have a complete answer with the current context, as often as the check policy allows
+                nodes_since_check += 1
+                tokens_since_check += node_tokens
+                if self._should_check_answer(nodes_since_check, tokens_since_check):
+                    nodes_since_check, tokens_since_check = 0, 0
+                    is_complete, answer = self._check_answer(query, "\n".join(context_chunks))
+                    if is_complete:
+                        final_answer = answer
+                        break
                 
                 # Process the concepts of the current node
                 node_concepts_set = set(self.knowledge_graph._lemmatize_concept(c) for c in node_concepts)
@@ -459,9 +1903,7 @@ class QueryEngine:
                     visited_concepts.update(node_concepts_set)
                     
                     # Explore neighbors
-                    for neighbor in self.knowledge_graph.graph.neighbors(current_node):
-                        edge_data = self.knowledge_graph.graph[current_node][neighbor]
-                        edge_weight = edge_data['weight']
+                    for neighbor, edge_weight in self.knowledge_graph.neighbors(current_node):
                         
                         # Calculate new distance (priority) to the neighbor
                         # Note: We use 1 / edge_weight because higher weights mean stronger connections
@@ -472,27 +1914,32 @@ class QueryEngine:
                             distances[neighbor] = distance
                             heapq.heappush(priority_queue, (distance, neighbor))
                             
-                            # Process the neighbor node if it's not already in our traversal path
-                            if neighbor not in traversal_path:
+                            # Process the neighbor node if it's not already in our traversal path and fits in the budget
+                            neighbor_tokens = int(self.knowledge_graph.token_counts[neighbor])
+                            if neighbor not in traversal_path and context_tokens + neighbor_tokens <= self.max_context_length:
                                 step += 1
                                 traversal_path.append(neighbor)
-                                neighbor_content = self.knowledge_graph.graph.nodes[neighbor]['content']
-                                neighbor_concepts = self.knowledge_graph.graph.nodes[neighbor]['concepts']
+                                neighbor_content = self.knowledge_graph.node_content(neighbor)
+                                neighbor_concepts = self.knowledge_graph.node_concepts(neighbor)
                                 
                                 filtered_content[neighbor] = neighbor_content
-                                expanded_context += "\n" + neighbor_content if expanded_context else neighbor_content
+                                context_chunks.append(neighbor_content)
+                                context_tokens += neighbor_tokens
                                 
                                 # Log the neighbor node information
-                                st.write(f"<span style='color:red;'>Step {step} - Node {neighbor} (neighbor of {current_node}):</span>", unsafe_allow_html=True)
-                                st.write(f"Content: {neighbor_content[:100]}...")
+                                self._report_step(step, neighbor, neighbor_content, detail=f"neighbor of {current_node}")
                                 print(f"Concepts: {', '.join(neighbor_concepts)}")
                                 print("-" * 50)
                                 
                                 # Check if we have a complete answer after adding the neighbor's content
-                                is_complete, answer = self._check_answer(query, expanded_context)
-                                if is_complete:
-                                    final_answer = answer
-                                    break
+                                nodes_since_check += 1
+                                tokens_since_check += neighbor_tokens
+                                if self._should_check_answer(nodes_since_check, tokens_since_check):
+                                    nodes_since_check, tokens_since_check = 0, 0
+                                    is_complete, answer = self._check_answer(query, "\n".join(context_chunks))
+                                    if is_complete:
+                                        final_answer = answer
+                                        break
                                 
                                 # Process the neighbor's concepts
                                 neighbor_concepts_set = set(self.knowledge_graph._lemmatize_concept(c) for c in neighbor_concepts)
@@ -503,25 +1950,341 @@ class QueryEngine:
                 if final_answer:
                     break
 
-        # If we haven't found a complete answer, generate one using the LLM
-        if not final_answer:
-            print("\nGenerating final answer...")
-            response_prompt = PromptTemplate(
-                input_variables=["query", "context"],
-                template="Based on the following context, please answer the query.\n\nContext: {context}\n\nQuery: {query}\n\nAnswer:"
-            )
-            response_chain = response_prompt | self.llm
-            input_data = {"query": query, "context": expanded_context}
-            final_answer = response_chain.invoke(input_data)
+        expanded_context = "\n".join(context_chunks)
+        self.last_query_stats['context_tokens'] = context_tokens
+        return expanded_context, traversal_path, filtered_content, final_answer
+
+    def _expand_context_ppr(self, query: str, relevant_docs, query_vector) -> Tuple[str, List[int], Dict[int, str], str]:
+        """
+        Expands the context with Personalized PageRank from the seed nodes instead of a step-by-step traversal.
+        
+        The seeds are weighted by their similarity to the query. Nodes are taken in order of PageRank score,
+        at most ppr_top_n of them and only while they fit in the max_context_length token budget, so that the
+        answer is generated with a single LLM call.
+        
+        Args:
+        - query (str): The query to be answered.
+        - relevant_docs (List[Document]): A list of relevant documents to start the traversal.
+        - query_vector (numpy.ndarray): The normalized query embedding, used to weight the seed nodes.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - expanded_context (str): The accumulated context from the selected nodes.
+          - traversal_path (List[int]): The selected node indices, by decreasing score.
+          - filtered_content (Dict[int, str]): A mapping of node indices to their content.
+          - final_answer (str): Always empty; the answer is generated from the context by the caller.
+        """
+        seed_nodes = list(dict.fromkeys(self.knowledge_graph.chunk_id(doc) for doc in relevant_docs))
+        if not seed_nodes:
+            return "", [], {}, ""
+        seed_similarities = np.maximum(np.asarray(self.knowledge_graph.embeddings[seed_nodes]) @ query_vector, 1e-6)
+        scores = self.knowledge_graph.personalized_pagerank(seed_nodes, seed_similarities, alpha=self.ppr_alpha)
+        
+        # Take the best scoring nodes that fit in the token budget
+        candidates = np.flatnonzero(scores)
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        token_counts = np.asarray(self.knowledge_graph.token_counts)[candidates]
+        fits = np.cumsum(token_counts) <= self.max_context_length
+        traversal_path = candidates[fits][:self.ppr_top_n].tolist()
+        # The budget only stopped the selection if it cut into the ppr_top_n best candidates
+        self.last_query_stats['budget_reached'] = not fits[:self.ppr_top_n].all()
+        self.last_query_stats['first_step_seconds'] = time.perf_counter() - self._query_start_time
+        
+        filtered_content = {node: self.knowledge_graph.node_content(node) for node in traversal_path}
+        expanded_context = "\n".join(filtered_content.values())
+        self.last_query_stats['context_tokens'] = int(token_counts[fits][:self.ppr_top_n].sum())
+        for step, node in enumerate(traversal_path, start=1):
+            self._report_step(step, node, filtered_content[node], detail=f"score {scores[node]:.4f}")
+        return expanded_context, traversal_path, filtered_content, ""
+
+    def _expand_context_shortest_path(self, query: str, relevant_docs, query_vector) -> Tuple[str, List[int], Dict[int, str], str]:
+        """
+        Expands the context in order of shortest distance from the seed nodes, computed by scipy's Dijkstra.
+        
+        Seeds start at the inverse of their similarity to the query and edges are 1 / weight long, as in
+        _expand_context. The whole visiting order is computed in one native multi-source call, cut off at
+        distance_limit; nodes are then added in that order under the token budget, with completeness checks
+        as often as check_policy allows.
+        
+        Args:
+        - query (str): The query to be answered.
+        - relevant_docs (List[Document]): A list of relevant documents to start the traversal.
+        - query_vector (numpy.ndarray): The normalized query embedding, used to score the seed nodes.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - expanded_context (str): The accumulated context from the visited nodes.
+          - traversal_path (List[int]): The visited node indices, by increasing distance.
+          - filtered_content (Dict[int, str]): A mapping of node indices to their content.
+          - final_answer (str): The final answer found, if any; otherwise it is generated from the context by the caller.
+        """
+        seed_nodes = list(dict.fromkeys(self.knowledge_graph.chunk_id(doc) for doc in relevant_docs))
+        if not seed_nodes:
+            return "", [], {}, ""
+        seed_similarities = np.maximum(np.asarray(self.knowledge_graph.embeddings[seed_nodes]) @ query_vector, 1e-6)
+        ordered_nodes, _ = self.knowledge_graph.shortest_path_order(seed_nodes, 1 / seed_similarities, limit=self.distance_limit)
+        
+        context_chunks = []
+        context_tokens = 0
+        traversal_path = []
+        filtered_content = {}
+        final_answer = ""
+        nodes_since_check = 0
+        tokens_since_check = 0
+        for node in ordered_nodes.tolist():
+            node_tokens = int(self.knowledge_graph.token_counts[node])
+            if context_tokens + node_tokens > self.max_context_length:
+                self.last_query_stats['budget_reached'] = True
+                break
+            
+            traversal_path.append(node)
+            self.last_query_stats.setdefault('first_step_seconds', time.perf_counter() - self._query_start_time)
+            filtered_content[node] = self.knowledge_graph.node_content(node)
+            context_chunks.append(filtered_content[node])
+            context_tokens += node_tokens
+            self._report_step(len(traversal_path), node, filtered_content[node])
+            
+            nodes_since_check += 1
+            tokens_since_check += node_tokens
+            if self._should_check_answer(nodes_since_check, tokens_since_check):
+                nodes_since_check, tokens_since_check = 0, 0
+                is_complete, answer = self._check_answer(query, "\n".join(context_chunks))
+                if is_complete:
+                    final_answer = answer
+                    break
+        
+        expanded_context = "\n".join(context_chunks)
+        self.last_query_stats['context_tokens'] = context_tokens
+        return expanded_context, traversal_path, filtered_content, final_answer
 
+    def _expand_context_beam(self, query: str, relevant_docs, query_vector) -> Tuple[str, List[int], Dict[int, str], str]:
+        """
+        Expands the context with a beam search over the graph, bounding the work done per query.
+        
+        The beam starts from the beam_width seeds most similar to the query. At each of at most max_hops hops,
+        every beam node proposes its fan_out strongest unvisited neighbors, which are scored by edge weight plus
+        novelty_weight times the share of their concepts not yet in the context. The beam_width best candidates
+        are added to the context, under the token budget and with completeness checks as often as check_policy
+        allows, and form the next beam.
+        
+        Args:
+        - query (str): The query to be answered.
+        - relevant_docs (List[Document]): A list of relevant documents to start the traversal.
+        - query_vector (numpy.ndarray): The normalized query embedding, used to rank the seed nodes.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - expanded_context (str): The accumulated context from the visited nodes.
+          - traversal_path (List[int]): The visited node indices, hop by hop.
+          - filtered_content (Dict[int, str]): A mapping of node indices to their content.
+          - final_answer (str): The final answer found, if any; otherwise it is generated from the context by the caller.
+        """
+        start_time = time.perf_counter()
+        adjacency = self.knowledge_graph.adjacency()
+        incidence = self.knowledge_graph.concept_incidence
+        seen_concepts = np.zeros(incidence.shape[1], dtype=bool)
+        
+        seed_nodes = np.array(list(dict.fromkeys(self.knowledge_graph.chunk_id(doc) for doc in relevant_docs)), dtype=np.int64)
+        if len(seed_nodes):
+            seed_similarities = np.asarray(self.knowledge_graph.embeddings[seed_nodes]) @ query_vector
+            seed_nodes = seed_nodes[np.argsort(-seed_similarities, kind="stable")]
+        beam = seed_nodes[:self.beam_width].tolist()
+        
+        context_chunks = []
+        context_tokens = 0
+        traversal_path = []
+        filtered_content = {}
+        visited = set()
+        final_answer = ""
+        nodes_since_check = 0
+        tokens_since_check = 0
+        candidates_scored = 0
+        hops = 0
+        while beam and not final_answer and not self.last_query_stats.get('budget_reached'):
+            # Add the beam to the context
+            for node in beam:
+                node_tokens = int(self.knowledge_graph.token_counts[node])
+                if context_tokens + node_tokens > self.max_context_length:
+                    self.last_query_stats['budget_reached'] = True
+                    break
+                
+                visited.add(node)
+                traversal_path.append(node)
+                self.last_query_stats.setdefault('first_step_seconds', time.perf_counter() - self._query_start_time)
+                seen_concepts[incidence.indices[incidence.indptr[node]:incidence.indptr[node + 1]]] = True
+                filtered_content[node] = self.knowledge_graph.node_content(node)
+                context_chunks.append(filtered_content[node])
+                context_tokens += node_tokens
+                self._report_step(len(traversal_path), node, filtered_content[node], detail=f"hop {hops}")
+                
+                nodes_since_check += 1
+                tokens_since_check += node_tokens
+                if self._should_check_answer(nodes_since_check, tokens_since_check):
+                    nodes_since_check, tokens_since_check = 0, 0
+                    is_complete, answer = self._check_answer(query, "\n".join(context_chunks))
+                    if is_complete:
+                        final_answer = answer
+                        break
+            
+            if hops == self.max_hops:
+                break
+            hops += 1
+            
+            # Collect the fan_out strongest unvisited neighbors of each beam node
+            candidates, weights = [], []
+            for node in beam:
+                start, stop = adjacency.indptr[node], adjacency.indptr[node + 1]
+                neighbors, edge_weights = adjacency.indices[start:stop], adjacency.data[start:stop]
+                unvisited = np.fromiter((neighbor not in visited for neighbor in neighbors.tolist()), dtype=bool, count=len(neighbors))
+                neighbors, edge_weights = neighbors[unvisited], edge_weights[unvisited]
+                strongest = np.argsort(-edge_weights, kind="stable")[:self.fan_out]
+                candidates.append(neighbors[strongest])
+                weights.append(edge_weights[strongest])
+            candidates, weights = np.concatenate(candidates), np.concatenate(weights)
+            if not len(candidates):
+                break
+            
+            # Score candidates by edge weight and concept novelty, keeping the best edge to each candidate
+            candidate_incidence = incidence[candidates]
+            concept_counts = np.diff(candidate_incidence.indptr)
+            new_concept_counts = np.asarray(candidate_incidence[:, ~seen_concepts].sum(axis=1)).ravel() if len(seen_concepts) else np.zeros(len(candidates))
+            novelty = np.divide(new_concept_counts, concept_counts, out=np.zeros(len(candidates)), where=concept_counts > 0)
+            scores = weights + self.novelty_weight * novelty
+            candidates_scored += len(candidates)
+            order = np.argsort(-scores, kind="stable")
+            beam = list(dict.fromkeys(candidates[order].tolist()))[:self.beam_width]
+        
+        self.last_query_stats.update({'hops': hops, 'candidates_scored': candidates_scored, 'context_tokens': context_tokens,
+                                      'traversal_seconds': time.perf_counter() - start_time})
+        expanded_context = "\n".join(context_chunks)
         return expanded_context, traversal_path, filtered_content, final_answer
 
-    def query(self, query: str) -> Tuple[str, List[int], Dict[int, str]]:
+    def _report_step(self, step, node, content, concepts=None, detail=""):
+        """
+        Reports a traversal step, to the registered step listener when streaming and to the Streamlit page otherwise.
+        
+        Args:
+        - step (int): The step number.
+        - node (int): The visited node.
+        - content (str): The content of the node.
+        - concepts (list of str): The concepts of the node, if they should be shown.
+        - detail (str): Extra information about how the node was reached.
+        
+        Returns:
+        - None
+        """
+        if self._step_listener is not None:
+            self._step_listener({'type': 'step', 'step': step, 'node': node, 'content': content, 'detail': detail})
+            return
+        st.write(f"<span style='color:red;'>Step {step} - Node {node}{f' ({detail})' if detail else ''}:</span>", unsafe_allow_html=True)
+        st.write(f"Content: {content[:100]}...")
+        if concepts is not None:
+            st.write(f"Concepts: {', '.join(concepts)}")
+
+    def _create_answer_chain(self, query: str, context: str):
+        """
+        Creates the chain that answers the query from the context, recording the call in the query statistics.
+        
+        Args:
+        - query (str): The query to be answered.
+        - context (str): The accumulated context.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - response_chain (Chain): The answer chain.
+          - input_data (dict): The inputs of the chain.
+        """
+        response_prompt = PromptTemplate(
+            input_variables=["query", "context"],
+            template="Based on the following context, please answer the query.\n\nContext: {context}\n\nQuery: {query}\n\nAnswer:"
+        )
+        input_data = {"query": query, "context": context}
+        self._record_llm_call(response_prompt.format(**input_data))
+        return response_prompt | self.llm, input_data
+
+    def _generate_answer(self, query: str, context: str):
+        """
+        Generates the answer to the query from the context with the LLM.
+        
+        The text of the model's message is returned, so query and stream_query cache and return the same type.
+        
+        Args:
+        - query (str): The query to be answered.
+        - context (str): The accumulated context.
+        
+        Returns:
+        - str: The generated answer.
+        """
+        response_chain, input_data = self._create_answer_chain(query, context)
+        response = response_chain.invoke(input_data)
+        return response.content if hasattr(response, 'content') else str(response)
+
+    def _traverse(self, query: str, query_vector, strategy: str):
+        """
+        Retrieves the relevant documents and expands the context with the given traversal strategy.
+        
+        Args:
+        - query (str): The query to be answered.
+        - query_vector (numpy.ndarray): The normalized query embedding.
+        - strategy (str): The traversal strategy.
+        
+        Returns:
+        - tuple: The expanded context, traversal path, filtered content and final answer found, if any.
+        """
+        if strategy == "dijkstra":
+            expand_context = self._expand_context
+        elif strategy == "shortest_path":
+            expand_context = self._expand_context_shortest_path
+        elif strategy == "beam":
+            expand_context = self._expand_context_beam
+        elif strategy == "ppr":
+            expand_context = self._expand_context_ppr
+        else:
+            raise ValueError(f"Unknown traversal strategy: {strategy}")
+        relevant_docs = self._retrieve_relevant_documents(query, query_vector)
+        return expand_context(query, relevant_docs, query_vector)
+
+    def _cached_answer(self, query: str, strategy: str):
+        """
+        Looks up the answer of a repeated or near-duplicate query in the answer cache.
+        
+        The query is embedded for a semantic lookup only if the cache has a similarity threshold.
+        
+        Args:
+        - query (str): The query to be answered.
+        - strategy (str): The traversal strategy.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - cached (dict or None): The cached entry, or None on a miss.
+          - query_vector (numpy.ndarray or None): The query embedding, if it had to be computed.
+        """
+        query_vector = None
+        if not self.use_answer_cache:
+            return None, query_vector
+        cached = self.answer_cache.get_exact(query, self.knowledge_graph.version, strategy)
+        if cached is None and self.answer_cache.threshold is not None:
+            query_vector = self._embed_query(query)
+            cached = self.answer_cache.get(query_vector, self.knowledge_graph.version, strategy)
+        if cached is not None:
+            self.last_query_stats.update({
+                'strategy': strategy,
+                'cache_hit': True,
+                'visited_nodes': len(cached['traversal_path']),
+                'wall_seconds': time.perf_counter() - self._query_start_time,
+            })
+        return cached, query_vector
+
+    def query(self, query: str, strategy: str = "dijkstra") -> Tuple[str, List[int], Dict[int, str]]:
         """
         Processes a query by retrieving relevant documents, expanding the context, and generating the final answer.
         
         Args:
         - query (str): The query to be answered.
+        - strategy (str): The traversal strategy: "dijkstra" for the step-by-step traversal with completeness
+          checks, "shortest_path" for the same distances computed by scipy.sparse.csgraph in one call, "beam"
+          for a beam search with bounded width, fan-out and hops, or "ppr" for Personalized PageRank followed
+          by a single answer call.
         
         Returns:
         - tuple: A tuple containing:
@@ -529,22 +2292,23 @@ class QueryEngine:
           - traversal_path (list): The traversal path of nodes in the knowledge graph.
           - filtered_content (dict): The filtered content of nodes.
         """
+        self._query_start_time = time.perf_counter()
+        self.last_query_stats = {}
+        # Answer repeated and near-duplicate queries from the cache, without any LLM call
+        cached, query_vector = self._cached_answer(query, strategy)
+        if cached is not None:
+            st.write(f"\nFinal Answer (cached): {cached['answer']}")
+            return cached['answer'], list(cached['traversal_path']), dict(cached['filtered_content'])
+        
         with get_openai_callback() as cb:
             st.write(f"\nProcessing query: {query}")
-            relevant_docs = self._retrieve_relevant_documents(query)
-            expanded_context, traversal_path, filtered_content, final_answer = self._expand_context(query, relevant_docs)
+            if query_vector is None:
+                query_vector = self._embed_query(query)
+            expanded_context, traversal_path, filtered_content, final_answer = self._traverse(query, query_vector, strategy)
             
             if not final_answer:
                 st.write("\nGenerating final answer...")
-                response_prompt = PromptTemplate(
-                    input_variables=["query", "context"],
-                    template="Based on the following context, please answer the query.\n\nContext: {context}\n\nQuery: {query}\n\nAnswer:"
-                )
-                
-                response_chain = response_prompt | self.llm
-                input_data = {"query": query, "context": expanded_context}
-                response = response_chain.invoke(input_data)
-                final_answer = response
+                final_answer = self._generate_answer(query, expanded_context)
             else:
                 st.write("\nComplete answer found during traversal.")
             
@@ -554,23 +2318,231 @@ class QueryEngine:
             print(f"Completion Tokens: {cb.completion_tokens}")
             print(f"Total Cost (USD): ${cb.total_cost}")
         
+        if self.use_answer_cache:
+            self.answer_cache.put(query, query_vector, self.knowledge_graph.version, strategy,
+                                  final_answer, traversal_path, filtered_content)
+        self.last_query_stats.update({
+            'strategy': strategy,
+            'cache_hit': False,
+            'check_policy': self.check_policy,
+            'visited_nodes': len(traversal_path),
+            'wall_seconds': time.perf_counter() - self._query_start_time,
+            'reported_prompt_tokens': cb.prompt_tokens,
+        })
         return final_answer, traversal_path, filtered_content
 
-    def _retrieve_relevant_documents(self, query: str):
+    def stream_query(self, query: str, strategy: str = "dijkstra"):
+        """
+        Processes a query like query, yielding traversal events as they happen and then the answer token by token.
+        
+        The retrieval and traversal run in a worker thread that reports each step, and the final answer is
+        generated with the LLM's streaming interface, so the first answer token arrives as soon as the model
+        produces it.
+        
+        Args:
+        - query (str): The query to be answered.
+        - strategy (str): The traversal strategy, as for query.
+        
+        Yields:
+        - dict: Events, each with a 'type':
+          - 'step': A traversal step, with 'step', 'node', 'content' and 'detail'.
+          - 'token': A piece of the answer, in 'text'.
+          - 'done': The end of the answer, with 'answer', 'traversal_path' and 'filtered_content'.
+        """
+        self._query_start_time = time.perf_counter()
+        self.last_query_stats = {}
+        cached, query_vector = self._cached_answer(query, strategy)
+        if cached is not None:
+            yield {'type': 'token', 'text': cached['answer']}
+            yield {'type': 'done', 'answer': cached['answer'], 'traversal_path': list(cached['traversal_path']),
+                   'filtered_content': dict(cached['filtered_content'])}
+            return
+        if query_vector is None:
+            query_vector = self._embed_query(query)
+        
+        # Run the traversal in a worker thread and pass its steps on as they are reported
+        events = queue.Queue()
+        result = {}
+        
+        def traverse():
+            try:
+                result['value'] = self._traverse(query, query_vector, strategy)
+            except Exception as error:
+                result['error'] = error
+            finally:
+                events.put(None)
+        
+        self._step_listener = events.put
+        worker = threading.Thread(target=traverse, daemon=True)
+        worker.start()
+        try:
+            while (event := events.get()) is not None:
+                yield event
+        finally:
+            worker.join()
+            self._step_listener = None
+        if 'error' in result:
+            raise result['error']
+        expanded_context, traversal_path, filtered_content, final_answer = result['value']
+        
+        # Stream the answer, unless a complete one was found during the traversal
+        if final_answer:
+            self.last_query_stats['first_token_seconds'] = time.perf_counter() - self._query_start_time
+            yield {'type': 'token', 'text': str(final_answer)}
+        else:
+            response_chain, input_data = self._create_answer_chain(query, expanded_context)
+            pieces = []
+            for chunk in response_chain.stream(input_data):
+                text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if not text:
+                    continue
+                self.last_query_stats.setdefault('first_token_seconds', time.perf_counter() - self._query_start_time)
+                pieces.append(text)
+                yield {'type': 'token', 'text': text}
+            final_answer = "".join(pieces)
+        
+        if self.use_answer_cache:
+            self.answer_cache.put(query, query_vector, self.knowledge_graph.version, strategy,
+                                  final_answer, traversal_path, filtered_content)
+        self.last_query_stats.update({
+            'strategy': strategy,
+            'cache_hit': False,
+            'check_policy': self.check_policy,
+            'visited_nodes': len(traversal_path),
+            'wall_seconds': time.perf_counter() - self._query_start_time,
+        })
+        yield {'type': 'done', 'answer': final_answer, 'traversal_path': traversal_path, 'filtered_content': filtered_content}
+
+    def compare_check_policies(self, queries, policies=("every_node", "every_k", "token_delta", "end")):
+        """
+        Runs a recorded workload of queries under several check policies and reports the cost of each.
+        
+        Args:
+        - queries (list of str): The queries to be answered.
+        - policies (tuple of str): The check policies to be compared.
+        
+        Returns:
+        - dict: For each policy, the total LLM calls, completeness checks, prompt tokens and wall seconds, and the answers.
+        """
+        original_policy, original_use_answer_cache = self.check_policy, self.use_answer_cache
+        self.use_answer_cache = False
+        report = {}
+        try:
+            for policy in policies:
+                self.check_policy = policy
+                totals = {'llm_calls': 0, 'check_calls': 0, 'prompt_tokens': 0, 'wall_seconds': 0.0, 'answers': []}
+                for query in queries:
+                    answer, _, _ = self.query(query)
+                    for name in ['llm_calls', 'check_calls', 'prompt_tokens', 'wall_seconds']:
+                        totals[name] += self.last_query_stats.get(name, 0)
+                    totals['answers'].append(answer)
+                report[policy] = totals
+        finally:
+            self.check_policy, self.use_answer_cache = original_policy, original_use_answer_cache
+        return report
+
+    def compare_strategies(self, queries, strategies=("dijkstra", "shortest_path", "beam", "ppr")):
+        """
+        Runs a recorded workload of queries under several traversal strategies and compares their cost and results.
+        
+        Overlaps are measured against the first strategy: the Jaccard similarity of the selected nodes, and of the
+        word sets of the answers.
+        
+        Args:
+        - queries (list of str): The queries to be answered.
+        - strategies (tuple of str): The traversal strategies to be compared.
+        
+        Returns:
+        - dict: For each strategy, the mean wall seconds, LLM calls and prompt tokens per query, and the mean
+          node and answer overlaps with the first strategy.
+        """
+        def jaccard(a, b):
+            return len(a & b) / len(a | b) if a | b else 1.0
+        
+        results = {strategy: [] for strategy in strategies}
+        original_use_answer_cache = self.use_answer_cache
+        self.use_answer_cache = False
+        try:
+            for query in queries:
+                for strategy in strategies:
+                    answer, traversal_path, _ = self.query(query, strategy=strategy)
+                    results[strategy].append((dict(self.last_query_stats), set(traversal_path), set(str(answer).lower().split())))
+        finally:
+            self.use_answer_cache = original_use_answer_cache
+        
+        report = {}
+        for strategy, runs in results.items():
+            baseline = results[strategies[0]]
+            report[strategy] = {
+                'wall_seconds': float(np.mean([stats['wall_seconds'] for stats, _, _ in runs])),
+                'llm_calls': float(np.mean([stats.get('llm_calls', 0) for stats, _, _ in runs])),
+                'prompt_tokens': float(np.mean([stats.get('prompt_tokens', 0) for stats, _, _ in runs])),
+                'visited_nodes': float(np.mean([stats['visited_nodes'] for stats, _, _ in runs])),
+                'first_step_seconds': float(np.mean([stats.get('first_step_seconds', 0.0) for stats, _, _ in runs])),
+                'node_overlap': float(np.mean([jaccard(nodes, base[1]) for (_, nodes, _), base in zip(runs, baseline)])),
+                'answer_overlap': float(np.mean([jaccard(words, base[2]) for (_, _, words), base in zip(runs, baseline)])),
+            }
+        return report
+
+    def _embed_query(self, query: str):
+        """
+        Embeds the query once, for both retrieval and scoring the starting nodes of the traversal.
+        
+        Args:
+        - query (str): The query to be answered.
+        
+        Returns:
+        - numpy.ndarray: The L2-normalized query embedding.
+        """
+        query_vector = np.asarray(self.vector_store.embeddings.embed_query(query), dtype=np.float32)
+        return query_vector / max(np.linalg.norm(query_vector), 1e-12)
+
+    def _retrieve_relevant_documents(self, query: str, query_vector):
         """
-        Retrieves relevant documents based on the query using the vector store.
+        Retrieves relevant documents for the query embedding from the vector store and compresses them.
+        
+        In "local" compression mode, each document is reduced to its compression_top_sentences sentences most
+        similar to the query, using the sentence embeddings computed at build time, without any LLM call.
+        In "llm" mode, or when the graph has no sentence embeddings, LLMChainExtractor makes one LLM call per
+        document. Compressed documents keep the metadata, and so the chunk id, of the chunk they came from.
         
         Args:
         - query (str): The query to be answered.
+        - query_vector (numpy.ndarray): The normalized query embedding.
         
         Returns:
         - list: A list of relevant documents.
         """
         print("\nRetrieving relevant documents...")
-        retriever = self.vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 5})
-        compressor = LLMChainExtractor.from_llm(self.llm)
-        compression_retriever = ContextualCompressionRetriever(base_compressor=compressor, base_retriever=retriever)
-        return compression_retriever.invoke(query)
+        start_time = time.perf_counter()
+        docs = self.vector_store.similarity_search_by_vector(query_vector.tolist(), k=self.retrieval_k)
+        if self.compression_mode == "local" and self.knowledge_graph.sentence_embeddings is not None:
+            compressed_docs = [self._compress_locally(doc, query_vector) for doc in docs]
+            self.last_query_stats['retrieval_seconds'] = time.perf_counter() - start_time
+            return compressed_docs
+        
+        for doc in docs:
+            self._record_llm_call(query + "\n" + doc.page_content)
+        compressed_docs = list(self.compressor.compress_documents(docs, query))
+        self.last_query_stats['retrieval_seconds'] = time.perf_counter() - start_time
+        return compressed_docs
+
+    def _compress_locally(self, doc, query_vector):
+        """
+        Keeps the sentences of a retrieved document that are most similar to the query, in their original order.
+        
+        Args:
+        - doc (Document): A document retrieved from the vector store.
+        - query_vector (numpy.ndarray): The normalized query embedding.
+        
+        Returns:
+        - Document: The compressed document, with the metadata of the original one.
+        """
+        sentences, vectors = self.knowledge_graph.sentence_vectors(self.knowledge_graph.chunk_id(doc))
+        if len(sentences) <= self.compression_top_sentences:
+            return doc
+        best = np.sort(np.argsort(-(vectors @ query_vector), kind="stable")[:self.compression_top_sentences])
+        return Document(page_content=" ".join(sentences[i] for i in best), metadata=doc.metadata)
 # Import necessary libraries
 import networkx as nx
 import matplotlib.pyplot as plt
@@ -716,6 +2688,9 @@ class GraphRAG:
         - knowledge_graph: An instance of the KnowledgeGraph class for building and managing the knowledge graph.
         - query_engine: An instance of the QueryEngine class for handling queries (initialized as None).
         - visualizer: An instance of the Visualizer class for visualizing the knowledge graph traversal.
+        - file_registry: A dictionary mapping the SHA-256 of every ingested file to its source name and page count.
+        - page_hashes: A dictionary mapping every ingested source name to the text hashes of its pages, in page order.
+        - last_ingest_stats: A dictionary counting the pages reused, processed and retired by the last ingestion.
         """
         self.llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini", max_tokens=4000)
         self.embedding_model = OpenAIEmbeddings()
@@ -724,6 +2699,9 @@ class GraphRAG:
         self.knowledge_graph = KnowledgeGraph()
         self.query_engine = None
         self.visualizer = Visualizer()
+        self.file_registry = {}
+        self.page_hashes = {}
+        self.last_ingest_stats = {}
 
     def process_documents(self, documents):
         """
@@ -735,28 +2713,180 @@ class GraphRAG:
         Returns:
         - None
         """
-        splits, vector_store = self.document_processor.process_documents(documents)
+        splits = self.document_processor.process_documents(documents)
+        self.file_registry = {}
+        self.page_hashes = {}
         self.knowledge_graph.build_graph(splits, self.llm, self.embedding_model)
-        self.query_engine = QueryEngine(vector_store, self.knowledge_graph, self.llm)
+        self.query_engine = QueryEngine(self.knowledge_graph.vector_store, self.knowledge_graph, self.llm)
 
-    def query(self, query: str):
+    def ingest_files(self, paths, sources=None):
+        """
+        Adds PDF files to the knowledge graph, skipping files whose bytes were already ingested.
+        
+        Files are identified by the SHA-256 of their contents, so re-uploading an unchanged file is a no-op.
+        A changed file with the source name of an ingested one replaces it page by page: pages whose text is
+        unchanged keep their nodes, the nodes of changed and removed pages are retired, and changed and new
+        pages are split and added to the graph incrementally, so the cost of an update scales with the
+        number of changed pages rather than with the size of the corpus. The new pages are added before the
+        old nodes are retired and the page hashes are recorded, so a failed update leaves the graph as it was
+        and can simply be retried.
+        
+        Args:
+        - paths (list of str): The paths of the PDF files.
+        - sources (list of str): The source name of each file, e.g. the uploaded file name; defaults to the paths.
+        
+        Returns:
+        - list: The source names of the files that were added.
+        """
+        sources = sources or list(paths)
+        new_files = {}
+        for path, source in zip(paths, sources):
+            digest = file_hash(path)
+            if digest not in self.file_registry and digest not in new_files:
+                new_files[digest] = (path, source)
+        if not new_files:
+            return []
+        
+        pages = list(extract_pdf_pages([path for path, _ in new_files.values()],
+                                       sources=[source for _, source in new_files.values()]))
+        pages_by_source = {}
+        for page in pages:
+            pages_by_source.setdefault(page.metadata['source'], []).append(page)
+        
+        self.last_ingest_stats = {'pages_reused': 0, 'pages_processed': 0, 'pages_retired': 0}
+        changed_pages = []
+        retired_pages = set()
+        page_hashes = {}
+        for source, source_pages in pages_by_source.items():
+            source_changed_pages, source_retired_pages = self._diff_pages(source, source_pages)
+            changed_pages.extend(source_changed_pages)
+            retired_pages.update((source, page_number) for page_number in source_retired_pages)
+            page_hashes[source] = [content_hash(page.page_content) for page in source_pages]
+        
+        # Look up the retired nodes before the replacement pages add nodes with the same source and page
+        retired_nodes = self.knowledge_graph.page_nodes(retired_pages)
+        new_splits = self.document_processor.process_documents(changed_pages) if changed_pages else []
+        self.knowledge_graph.add_splits(new_splits, self.llm, self.embedding_model)
+        self.knowledge_graph.retire_nodes(retired_nodes)
+        self.page_hashes.update(page_hashes)
+        self.query_engine = QueryEngine(self.knowledge_graph.vector_store, self.knowledge_graph, self.llm)
+        
+        # Replaced versions of a source are no longer part of the graph
+        self.file_registry = {digest: entry for digest, entry in self.file_registry.items() if entry['source'] not in pages_by_source}
+        for digest, (_, source) in new_files.items():
+            self.file_registry[digest] = {'source': source, 'pages': len(pages_by_source.get(source, []))}
+        return [source for _, source in new_files.values()]
+
+    def _diff_pages(self, source, source_pages):
+        """
+        Compares the pages of a file with the page hashes of the ingested version of its source.
+        
+        A page is unchanged when the ingested version has the same text at the same page number. Pages that
+        moved are treated as changed; their chunks are still answered from the embedding and concept caches.
+        
+        Args:
+        - source (str): The source name of the file.
+        - source_pages (list of Document): The pages of the file, in page order.
+        
+        Returns:
+        - tuple: A tuple containing:
+          - changed_pages (list of Document): The pages that are new or whose text changed.
+          - retired_pages (list of int): The page numbers of the ingested version whose nodes must be retired.
+        """
+        old_hashes = self.page_hashes.get(source, [])
+        new_hashes = [content_hash(page.page_content) for page in source_pages]
+        changed_pages = [page for page_number, (page, page_hash) in enumerate(zip(source_pages, new_hashes))
+                         if page_number >= len(old_hashes) or old_hashes[page_number] != page_hash]
+        retired_pages = [page_number for page_number, page_hash in enumerate(old_hashes)
+                         if page_number >= len(new_hashes) or new_hashes[page_number] != page_hash]
+        
+        self.last_ingest_stats['pages_reused'] += len(source_pages) - len(changed_pages)
+        self.last_ingest_stats['pages_processed'] += len(changed_pages)
+        self.last_ingest_stats['pages_retired'] += len(retired_pages)
+        return changed_pages, retired_pages
+
+    def query(self, query: str, strategy: str = "dijkstra"):
         """
         Handles a query by retrieving relevant information from the knowledge graph and visualizing the traversal path.
         
+        A cached answer is returned without redrawing its traversal, since drawing the graph takes far
+        longer than the cache lookup.
+        
         Args:
         - query (str): The query to be answered.
+        - strategy (str): The traversal strategy, "dijkstra", "shortest_path", "beam" or "ppr".
         
         Returns:
         - str: The response to the query.
         """
-        response, traversal_path, filtered_content = self.query_engine.query(query)
+        response, traversal_path, filtered_content = self.query_engine.query(query, strategy=strategy)
         
-        if traversal_path:
+        if self.query_engine.last_query_stats.get('cache_hit'):
+            print("Cached answer; traversal not redrawn.")
+        elif traversal_path:
             self.visualizer.visualize_traversal(self.knowledge_graph.graph, traversal_path)
         else:
             print("No traversal path to visualize.")
         
         return response
+
+    def stream_query(self, query: str, strategy: str = "dijkstra"):
+        """
+        Handles a query like query, yielding traversal events and then answer tokens as they are produced.
+        
+        Args:
+        - query (str): The query to be answered.
+        - strategy (str): The traversal strategy, "dijkstra", "shortest_path", "beam" or "ppr".
+        
+        Yields:
+        - dict: The events of QueryEngine.stream_query; the traversal of an uncached answer is visualized
+          before the 'done' event.
+        """
+        for event in self.query_engine.stream_query(query, strategy=strategy):
+            if event['type'] == 'done' and event['traversal_path'] and not self.query_engine.last_query_stats.get('cache_hit'):
+                self.visualizer.visualize_traversal(self.knowledge_graph.graph, event['traversal_path'])
+            yield event
+
+    def save(self, path):
+        """
+        Saves the knowledge graph and vector store as a snapshot, so the documents need not be processed again.
+        
+        The file registry and page hashes are stored with the snapshot, so re-uploading those files after
+        loading is a no-op and revised files are diffed page by page.
+        
+        Args:
+        - path (str): The snapshot directory.
+        
+        Returns:
+        - None
+        """
+        self.knowledge_graph.save(path)
+        with open(os.path.join(path, "file_registry.json"), "w") as f:
+            json.dump({'files': self.file_registry, 'page_hashes': self.page_hashes}, f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Creates a GraphRAG system ready for queries from a snapshot written by save.
+        
+        Args:
+        - path (str): The snapshot directory.
+        
+        Returns:
+        - GraphRAG: The loaded GraphRAG system.
+        """
+        graph_rag = cls()
+        knowledge_graph = KnowledgeGraph.load(path, graph_rag.embedding_model)
+        graph_rag.knowledge_graph = knowledge_graph
+        graph_rag.query_engine = QueryEngine(knowledge_graph.vector_store, knowledge_graph, graph_rag.llm)
+        
+        # Recover the file registry, so that later files can be added to the loaded graph
+        registry_path = os.path.join(path, "file_registry.json")
+        if os.path.exists(registry_path):
+            with open(registry_path) as f:
+                registry = json.load(f)
+            graph_rag.file_registry, graph_rag.page_hashes = registry['files'], registry['page_hashes']
+        return graph_rag
     
 
 
@@ -880,12 +3010,9 @@ def main():
                 tmp_project.write(project_file.read())
                 project_path = tmp_project.name
 
-            # Load the PDFs using PyPDFLoader
-            portfolio_loader = PyPDFLoader(portfolio_path)
-            project_loader = PyPDFLoader(project_path)
-            portfolio_documents = portfolio_loader.load()
-            project_documents = project_loader.load()
-            combined_documents = portfolio_documents + project_documents
+            # Load the PDFs page by page with the shared parallel extractor
+            combined_documents = list(extract_pdf_pages([portfolio_path, project_path],
+                                                        sources=[portfolio_file.name, project_file.name]))
             st.session_state['documents'] = combined_documents[:10]  # Limit for testing
             st.session_state['ready'] = True
             st.success("Both portfolio and project PDFs have been processed and are ready for queries.")
@@ -5,7 +5,7 @@ from langchain_core.prompts import PromptTemplate
 from langchain.retrievers import ContextualCompressionRetriever
 from langchain.retrievers.document_compressors import LLMChainExtractor
 from langchain_community.callbacks import get_openai_callback
-from langchain_community.document_loaders import PyPDFLoader
+from pdf_extraction import extract_pdf_pages
 from sklearn.metrics.pairwise import cosine_similarity
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
@@ -834,18 +834,15 @@ def load_and_process_documents(portfolio_file, project_file):
     with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
         tmp_file.write(portfolio_file.read())
         portfolio_path = tmp_file.name
-    portfolio_loader = PyPDFLoader(portfolio_path)
-    portfolio_docs = portfolio_loader.load()
     
     # Process Project Document
     with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
         tmp_file.write(project_file.read())
         project_path = tmp_file.name
-    project_loader = PyPDFLoader(project_path)
-    project_docs = project_loader.load()
 
-    # Combine documents
-    combined_docs = portfolio_docs + project_docs
+    # Extract both documents page by page with the shared parallel extractor
+    combined_docs = list(extract_pdf_pages([portfolio_path, project_path],
+                                           sources=[portfolio_file.name, project_file.name]))
     st.session_state['documents'] = combined_docs[:10]  # Limit for testing
     st.session_state['ready'] = True
 
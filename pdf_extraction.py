@@ -0,0 +1,104 @@
+import os
+import sys
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF library
+from langchain_core.documents import Document
+
+
+def _extract_page_range(task):
+    """
+    Extracts the text of a range of pages of a PDF; runs in a worker process.
+
+    Args:
+    - task (tuple): The (path, first_page, stop_page) of the range.
+
+    Returns:
+    - list: The text of each page in the range.
+    """
+    path, first_page, stop_page = task
+    with fitz.open(path) as pdf:
+        return [pdf[page_number].get_text() for page_number in range(first_page, stop_page)]
+
+
+def _page_ranges(paths, pages_per_task):
+    """
+    Splits the pages of several PDFs into ranges of at most pages_per_task pages.
+
+    Args:
+    - paths (list of str): The paths of the PDFs.
+    - pages_per_task (int): The maximum number of pages per range.
+
+    Returns:
+    - list: The (file_index, path, first_page, stop_page) of every range, in page order.
+    """
+    ranges = []
+    for file_index, path in enumerate(paths):
+        with fitz.open(path) as pdf:
+            page_count = pdf.page_count
+        for first_page in range(0, page_count, pages_per_task):
+            ranges.append((file_index, path, first_page, min(first_page + pages_per_task, page_count)))
+    return ranges
+
+
+def extract_pdf_pages(paths, sources=None, max_workers=None, pages_per_task=4):
+    """
+    Extracts the text of PDFs page by page, fanning the pages out across a process pool.
+
+    Pages are yielded in order as soon as they are available, one Document per page, so callers can start
+    splitting before the last page is extracted. With max_workers=1 the pages are extracted serially in
+    the calling process.
+
+    Args:
+    - paths (list of str): The paths of the PDFs.
+    - sources (list of str): The source name of each PDF, e.g. the uploaded file name; defaults to the paths.
+    - max_workers (int): The number of worker processes; defaults to the number of CPUs.
+    - pages_per_task (int): The number of pages each worker extracts per task.
+
+    Yields:
+    - Document: The text of a page, with 'source' and 'page' (0-based) metadata.
+    """
+    sources = sources or list(paths)
+    ranges = _page_ranges(paths, pages_per_task)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if max_workers == 1 or len(ranges) <= 1:
+        results = (_extract_page_range((path, first_page, stop_page)) for _, path, first_page, stop_page in ranges)
+        for (file_index, _, first_page, _), texts in zip(ranges, results):
+            for page_number, text in enumerate(texts, start=first_page):
+                yield Document(page_content=text, metadata={'source': sources[file_index], 'page': page_number})
+        return
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(ranges))) as executor:
+        futures = [executor.submit(_extract_page_range, (path, first_page, stop_page))
+                   for _, path, first_page, stop_page in ranges]
+        for (file_index, _, first_page, _), future in zip(ranges, futures):
+            for page_number, text in enumerate(future.result(), start=first_page):
+                yield Document(page_content=text, metadata={'source': sources[file_index], 'page': page_number})
+
+
+def benchmark_extraction(paths, repeats=3):
+    """
+    Compares the pages per second of serial and process-parallel extraction.
+
+    Args:
+    - paths (list of str): The paths of the PDFs.
+    - repeats (int): The number of times each extraction is repeated.
+
+    Returns:
+    - dict: The number of pages and the pages per second of the serial and parallel extraction.
+    """
+    report = {}
+    for name, max_workers in [('serial', 1), ('parallel', None)]:
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            num_pages = sum(1 for _ in extract_pdf_pages(paths, max_workers=max_workers))
+        report['pages'] = num_pages
+        report[f'{name}_pages_per_second'] = repeats * num_pages / (time.perf_counter() - start_time)
+    return report
+
+
+if __name__ == "__main__":
+    pdf_paths = sys.argv[1:] or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Portfolios", "*.pdf")))
+    print(benchmark_extraction(pdf_paths))
@@ -0,0 +1,105 @@
+import os
+import json
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+# Bump whenever the layout of a snapshot directory changes
+SNAPSHOT_FORMAT_VERSION = 4
+
+
+# Define the StringStore class
+class StringStore:
+    def __init__(self, data, offsets):
+        """
+        Initializes a read-only store of strings kept as one UTF-8 buffer plus an offsets array.
+
+        Strings are decoded only when accessed, so opening a store memory-maps the files without
+        creating any Python objects per entry.
+
+        Attributes:
+        - data: A uint8 array (usually a memory map) holding the concatenated UTF-8 bytes.
+        - offsets: An int64 array of length n + 1; string i spans data[offsets[i]:offsets[i + 1]].
+        """
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def write(cls, path, strings):
+        """
+        Writes strings to path + ".bin" and their offsets to path + ".offsets.npy".
+
+        Args:
+        - path (str): The path prefix of the store files.
+        - strings (iterable of str): The strings to be stored.
+
+        Returns:
+        - None
+        """
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        with open(path + ".bin", "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(path + ".offsets.npy", offsets)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Opens a store written by StringStore.write, memory-mapping both files.
+
+        Args:
+        - path (str): The path prefix of the store files.
+
+        Returns:
+        - StringStore: The opened store.
+        """
+        offsets = np.load(path + ".offsets.npy", mmap_mode="r")
+        if os.path.getsize(path + ".bin") == 0:
+            data = np.empty(0, dtype=np.uint8)
+        else:
+            data = np.memmap(path + ".bin", dtype=np.uint8, mode="r")
+        return cls(data, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.data[int(self.offsets[index]):int(self.offsets[index + 1])].tobytes().decode("utf-8")
+
+
+# Define the ChunkDocstore class
+class ChunkDocstore(Docstore, AddableMixin):
+    def __init__(self, chunk_store, metadata_store):
+        """
+        Initializes a FAISS docstore that builds Documents from a snapshot's chunk store on demand.
+
+        Docstore ids are node ids as strings. Documents added after loading are kept in memory.
+
+        Attributes:
+        - chunk_store: A StringStore of chunk texts, indexed by node id.
+        - metadata_store: A StringStore of JSON-encoded chunk metadata, indexed by node id.
+        - added: A dictionary of Documents added after loading.
+        - deleted: A set of docstore ids deleted after loading.
+        """
+        self.chunk_store = chunk_store
+        self.metadata_store = metadata_store
+        self.added = {}
+        self.deleted = set()
+
+    def search(self, search):
+        if search in self.added:
+            return self.added[search]
+        if search not in self.deleted and search.isdigit() and int(search) < len(self.chunk_store):
+            node = int(search)
+            return Document(page_content=self.chunk_store[node], metadata=json.loads(self.metadata_store[node]))
+        return f"ID {search} not found."
+
+    def add(self, texts):
+        self.added.update(texts)
+        self.deleted.difference_update(texts)
+
+    def delete(self, ids):
+        for id_ in ids:
+            self.added.pop(id_, None)
+            self.deleted.add(id_)
@@ -3,8 +3,6 @@ import tempfile
 from streamlit_chat import message
 from langchain.schema import HumanMessage, AIMessage
 from draft1_graphrag import GraphRAG
-import fitz  # PyMuPDF library
-from langchain.schema import Document  # Import Document class for wrapping text content
 
 # Page configuration
 st.set_page_config(page_title="Knowledge Assistant", page_icon="📘")
@@ -94,14 +92,6 @@ def display_title(organization):
 def check_login(username, password):
     return username == st.secrets["USERNAME"] and password == st.secrets["PASSWORD"]
 
-# Load PDF text
-def load_pdf(file_path):
-    text = ""
-    with fitz.open(file_path) as pdf:
-        for page_num in range(pdf.page_count):
-            text += pdf[page_num].get_text()
-    return text
-
 # Initialize session state
 for key in ["logged_in", "ready", "chat_history", "documents", "graph_rag", "organization"]:
     if key not in st.session_state:
@@ -129,23 +119,23 @@ def main():
     uploaded_files = st.file_uploader("Upload your Project PDFs here:", type="pdf", accept_multiple_files=True)
     if uploaded_files and st.button("Process Documents"):
         with st.spinner("Processing your documents..."):
-            combined_text = ""  # Combine all PDF texts into one string
+            file_paths = []
             for file in uploaded_files:
                 with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
                     tmp_file.write(file.read())
-                    file_path = tmp_file.name
-                
-                # Extract text from the PDF
-                combined_text += load_pdf(file_path) + "\n"  # Combine PDF content
+                    file_paths.append(tmp_file.name)
             
             # Initialize GraphRAG if not already initialized
             if 'graph_rag' not in st.session_state or not isinstance(st.session_state['graph_rag'], GraphRAG):
                 st.session_state['graph_rag'] = GraphRAG()
 
-            # Process the combined document as a single entity
-            st.session_state['graph_rag'].process_documents([Document(page_content=combined_text)])
+            # Add the files not ingested yet; their pages are extracted in parallel and keep their source and page
+            added_files = st.session_state['graph_rag'].ingest_files(file_paths, sources=[file.name for file in uploaded_files])
             st.session_state['ready'] = True
-            st.success("Documents processed successfully! You can now start a conversation.")
+            if added_files:
+                st.success("Documents processed successfully! You can now start a conversation.")
+            else:
+                st.success("These documents were already processed. You can continue the conversation.")
 
     # Divider for UI separation
     st.divider()
@@ -169,14 +159,21 @@ def main():
                 st.session_state['chat_history'].append((f"**You:** {user_query}", None))
                 message(f"**You:** {user_query}", is_user=True)
 
-                # Process user query and get a response
-                with st.spinner("Assistant is typing..."):
-                    response = st.session_state['graph_rag'].query(user_query)
-                    response_str = response.content if isinstance(response, AIMessage) else str(response)
+                # Stream the traversal steps and then the answer tokens as they are produced
+                status = st.status("Searching the knowledge graph...")
+
+                def answer_tokens():
+                    for event in st.session_state['graph_rag'].stream_query(user_query):
+                        if event['type'] == 'step':
+                            status.write(f"Step {event['step']} - Node {event['node']}: {event['content'][:100]}...")
+                        elif event['type'] == 'token':
+                            status.update(label="Answering...", state="complete")
+                            yield event['text']
+
+                response_str = st.write_stream(answer_tokens())
 
-                # Append assistant's response to chat history
+                # Append assistant's response to chat history; it was already rendered while streaming
                 st.session_state['chat_history'][-1] = (f"**You:** {user_query}", f"**Assistant:** {response_str}")
-                message(f"**Assistant:** {response_str}")
 
 
 if __name__ == "__main__":